@@ -0,0 +1,57 @@
+"""
+Synthetic brainstorm training examples shared by the optimization scripts
+"""
+
+import dspy
+from typing import Dict, List, Tuple
+
+# Diverse synthetic requests covering the real genre system
+SYNTHETIC_EXAMPLES_DATA = [
+    # 女频 - 爱情类
+    {"genre": "甜宠", "platform": "抖音", "requirements_section": "浪漫甜蜜的爱情故事，适合年轻观众"},
+    {"genre": "虐恋", "platform": "小红书", "requirements_section": "充满波折、痛苦和情感挣扎的爱情故事"},
+    {"genre": "霸总", "platform": "快手", "requirements_section": "高冷型霸道总裁，节奏紧凑"},
+    
+    # 女频 - 设定类
+    {"genre": "穿越", "platform": "抖音", "requirements_section": "身穿或魂穿，古代现代背景都可"},
+    {"genre": "重生", "platform": "小红书", "requirements_section": "重生题材，复仇或改变命运"},
+    {"genre": "马甲", "platform": "快手", "requirements_section": "多重身份设定，反转惊喜"},
+    {"genre": "替身", "platform": "抖音", "requirements_section": "真假千金，双胞胎替换"},
+    
+    # 女频 - 其他类型
+    {"genre": "萌宝", "platform": "小红书", "requirements_section": "可爱萌娃，温馨家庭"},
+    {"genre": "团宠", "platform": "快手", "requirements_section": "被全家宠爱的设定"},
+    {"genre": "娱乐圈", "platform": "抖音", "requirements_section": "娱乐圈背景，明星生活"},
+    
+    # 男频 - 设定类
+    {"genre": "玄幻", "platform": "快手", "requirements_section": "修炼成仙，升级打怪"},
+    {"genre": "末世", "platform": "抖音", "requirements_section": "末日求生，丧尸题材，制作成本可控"},
+    
+    # 男频 - 逆袭类
+    {"genre": "战神", "platform": "小红书", "requirements_section": "强者归来，兵王题材"},
+    {"genre": "神豪", "platform": "抖音", "requirements_section": "一夜暴富，点石成金"},
+    {"genre": "赘婿", "platform": "快手", "requirements_section": "赘婿逆袭，扮猪吃老虎"},
+    {"genre": "逆袭", "platform": "小红书", "requirements_section": "小人物成长，马甲大佬"},
+    {"genre": "金手指", "platform": "抖音", "requirements_section": "超能力，系统选中"},
+    {"genre": "高手下山", "platform": "快手", "requirements_section": "隐世高手重出江湖"},
+    
+    # 男频 - 其他类型
+    {"genre": "神医", "platform": "小红书", "requirements_section": "医术高超，悬壶济世"},
+]
+
+def _check_unique(examples_data: List[Dict[str, str]]) -> None:
+    """Fail at import on a repeated request; each one adds a full row of compile-time LLM calls"""
+    seen = set()
+    for data in examples_data:
+        key = (data["genre"], data["platform"], data["requirements_section"])
+        if key in seen:
+            raise ValueError(f"重复的训练样例: {key}")
+        seen.add(key)
+
+_check_unique(SYNTHETIC_EXAMPLES_DATA)
+
+# Built once at import with the input fields configured; callers copy into a list when they need one
+SYNTHETIC_TRAINING_EXAMPLES: Tuple[dspy.Example, ...] = tuple(
+    dspy.Example(**data).with_inputs("genre", "platform", "requirements_section")
+    for data in SYNTHETIC_EXAMPLES_DATA
+)
@@ -1,7 +1,14 @@
 import dspy
-from typing import List
-from common import StoryIdea, BrainstormRequest
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from common import (
+    StoryIdea, BrainstormRequest, parse_indexed_ideas, parse_story_ideas, cached_predict,
+    max_concurrent_llm_calls, BATCH_DEDUP_MAX_TEMPERATURE, submit_batch, poll_batch, fetch_batch_results
+)
 
+# Input fields are rendered in declaration order, so inputs that stay constant across
+# a sweep come first and the free-form requirements last, keeping the longest possible
+# prompt prefix identical for provider-side prefix caching.
 class BrainstormSignature(dspy.Signature):
     """Signature for brainstorming a single story idea"""
     genre = dspy.InputField(desc="故事类型/题材")
@@ -10,6 +17,17 @@ class BrainstormSignature(dspy.Signature):
     title = dspy.OutputField(desc="故事创意的标题（3-7个字符）")
     body = dspy.OutputField(desc="完整的故事梗概（180字以内，包含起承转合结构）")
 
+class BrainstormBatchSignature(dspy.Signature):
+    """Signature for brainstorming several story ideas in a single request"""
+    genre = dspy.InputField(desc="故事类型/题材")
+    platform = dspy.InputField(desc="目标平台")
+    n_ideas = dspy.InputField(desc="需要生成的故事创意数量")
+    requirements_section = dspy.InputField(desc="额外要求", default="")
+    story_ideas = dspy.OutputField(
+        desc="生成恰好 n_ideas 个互不相同的故事创意，用[序号]标记每个创意，格式为："
+             "[1] 标题: 故事创意的标题（3-7个字符） 故事: 完整的故事梗概（180字以内，包含起承转合结构）"
+    )
+
 class BrainstormModule(dspy.Module):
     """DSPy module for generating story brainstorming ideas"""
     
@@ -17,12 +35,16 @@ class BrainstormModule(dspy.Module):
         super().__init__()
         self.generate_idea = dspy.Predict(BrainstormSignature)
     
-    def forward(self, genre: str, platform: str, requirements_section: str = "") -> StoryIdea:
-        """Generate a single story idea based on the input parameters"""
+    def forward(self, genre: str, platform: str, requirements_section: str = "", n_ideas: int = 1) -> StoryIdea:
+        """Generate story ideas based on the input parameters (one LLM call regardless of n_ideas)"""
+        
+        if n_ideas > 1:
+            return self._forward_batch_prompt(genre, platform, requirements_section, n_ideas)
         
         # Pure DSPy approach - let DSPy figure out the optimal prompt
         # Only pass user requirements, no baseline prompt
-        response = self.generate_idea(
+        response = cached_predict(
+            self.generate_idea,
             genre=genre,
             platform=platform,
             requirements_section=requirements_section
@@ -34,5 +56,141 @@ class BrainstormModule(dspy.Module):
             body=response.body,
             story_idea=StoryIdea(title=response.title, body=response.body)
         )
+    
+    def forward_batch(self, requests: List[BrainstormRequest]) -> List[dspy.Prediction]:
+        """Run forward for independent requests concurrently, returning predictions in request order"""
+        if not requests:
+            return []
+        
+        # DSPy settings are thread-local, so hand the caller's LM to every worker thread
+        lm = dspy.settings.lm
+        
+        def run(request: BrainstormRequest, fresh_sample: bool) -> dspy.Prediction:
+            # A repeated request asks for a new sample instead of the LM cache's copy of the first one
+            with dspy.context(lm=lm, cache_creative=not fresh_sample):
+                return self(
+                    genre=request.genre,
+                    platform=request.platform,
+                    requirements_section=request.requirements_section
+                )
+        
+        # Near-deterministic sampling gives the same answer for the same request, so only
+        # send each distinct request once; creative sampling keeps every request
+        temperature = lm.kwargs.get('temperature') or 0.0
+        if temperature > BATCH_DEDUP_MAX_TEMPERATURE:
+            unique_requests = list(requests)
+            seen = set()
+            fresh_samples = []
+            for request in requests:
+                fresh_samples.append(request in seen)
+                seen.add(request)
+        else:
+            unique_requests = list(dict.fromkeys(requests))
+            fresh_samples = [False] * len(unique_requests)
+            if len(unique_requests) < len(requests):
+                print(f"  ♻️ 批量请求去重: {len(requests)} -> {len(unique_requests)} ({1 - len(unique_requests) / len(requests):.0%} 节省)")
+        
+        with ThreadPoolExecutor(max_workers=min(max_concurrent_llm_calls(), len(unique_requests))) as executor:
+            predictions = list(executor.map(run, unique_requests, fresh_samples))
+        
+        if len(unique_requests) == len(requests):
+            return predictions
+        by_request = dict(zip(unique_requests, predictions))
+        return [by_request[request] for request in requests]
+    
+    def forward_batch_offline(self, requests: List[BrainstormRequest], urgent: bool = False) -> List[Optional[dspy.Prediction]]:
+        """Generate ideas for many requests through the provider's Batch API (cheaper, but may take hours).
+        
+        Returns predictions in request order, with None for requests that failed. Pass urgent=True
+        to run the requests in real time with forward_batch instead.
+        """
+        if urgent or not requests:
+            return self.forward_batch(requests)
+        
+        # Read here rather than at import, which would load .env as soon as this module is imported
+        from common import LLM_MODEL_NAME
+        
+        # Render the exact prompt the predictor would send, including optimized instructions and demos
+        adapter = dspy.settings.adapter or dspy.ChatAdapter()
+        signature = self.generate_idea.signature
+        lm = dspy.settings.lm
+        lm_kwargs = {k: v for k, v in lm.kwargs.items() if k in ('temperature', 'max_tokens', 'stop')}
+        bodies = []
+        for request in requests:
+            messages = adapter.format(
+                signature,
+                demos=self.generate_idea.demos,
+                inputs={
+                    'genre': request.genre,
+                    'platform': request.platform,
+                    'requirements_section': request.requirements_section
+                }
+            )
+            bodies.append({'model': LLM_MODEL_NAME, 'messages': messages, **lm_kwargs})
+        
+        completions = fetch_batch_results(poll_batch(submit_batch(bodies)))
+        
+        predictions = []
+        for i in range(len(requests)):
+            completion = completions.get(i)
+            if completion is None:
+                predictions.append(None)
+                continue
+            try:
+                fields = adapter.parse(signature, completion)
+            except Exception as e:
+                print(f"  ⚠️ 无法解析批量结果 {i}: {e}")
+                predictions.append(None)
+                continue
+            predictions.append(dspy.Prediction(
+                title=fields['title'],
+                body=fields['body'],
+                story_idea=StoryIdea(title=fields['title'], body=fields['body'])
+            ))
+        return predictions
+    
+    def _forward_batch_prompt(self, genre: str, platform: str, requirements_section: str, n_ideas: int) -> dspy.Prediction:
+        """Generate n_ideas ideas with one batch-prompted call to the same predictor"""
+        # Reuse the optimized predictor (and its demos) with the batch signature so the
+        # optimizer does not see an extra predictor to tune
+        response = cached_predict(
+            self.generate_idea,
+            signature=BrainstormBatchSignature,
+            demos=self._batch_demos(),
+            genre=genre,
+            platform=platform,
+            requirements_section=requirements_section,
+            n_ideas=n_ideas
+        )
+        
+        story_ideas = parse_indexed_ideas(response.story_ideas)
+        if not story_ideas:
+            # Fall back to JSON parsing in case the LLM answered with a JSON array
+            story_ideas = parse_story_ideas(response.story_ideas)
+        if not story_ideas:
+            raise ValueError(f"未能从批量生成结果中解析出故事创意: {response.story_ideas[:200]}")
+        
+        story_ideas = story_ideas[:n_ideas]
+        first_idea = story_ideas[0]
+        return dspy.Prediction(
+            title=first_idea.title,
+            body=first_idea.body,
+            story_idea=first_idea,
+            story_ideas=story_ideas
+        )
+    
+    def _batch_demos(self) -> List[dspy.Example]:
+        """Convert single-idea (title/body) demos into the indexed batch format"""
+        demos = []
+        for demo in self.generate_idea.demos:
+            if not (hasattr(demo, 'title') and hasattr(demo, 'body')):
+                continue
+            demos.append(dspy.Example(
+                genre=demo.genre,
+                platform=demo.platform,
+                requirements_section=getattr(demo, 'requirements_section', ''),
+                n_ideas=1,
+                story_ideas=f"[1] 标题: {demo.title} 故事: {demo.body}"
+            ))
+        return demos
 
- 
\ No newline at end of file
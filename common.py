@@ -1,54 +1,154 @@
 import os
-import dspy
-from dotenv import dotenv_values
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
+from functools import cache
 import json
+import orjson
 import re
+import time
+import threading
+from operator import itemgetter
 
-# Load configuration
-config = dotenv_values(".env")
-LLM_API_KEY = config["LLM_API_KEY"]
-LLM_BASE_URL = config["LLM_BASE_URL"]
-LLM_MODEL_NAME = config["LLM_MODEL_NAME"]
+# dspy (and the litellm/openai stack behind it) is imported lazily, so code that only needs the
+# data classes and parsers - e.g. workers parsing offline batch results - starts in milliseconds
 
 # CONFIGURATION CONSTANTS
 MAX_TOKENS_GENERATION = 3000  # Increased to prevent JSON truncation
 MAX_TOKENS_EVALUATION = 2000  # For evaluation tasks
+RESPONSE_CACHE_MAX_TEMPERATURE = 1.0  # Above this, callers asking for fresh samples (cache_creative=False) bypass DSPy's LM cache
+DEFAULT_CONCURRENT_LLM_CALLS = 16  # Upper bound on parallel LLM requests everywhere unless DSPY_CONCURRENCY overrides it
+LLM_REQUESTS_PER_MINUTE = 500  # Client-side request budget, kept under the provider's RPM limit to avoid 429 retry storms
+BATCH_DEDUP_MAX_TEMPERATURE = 0.5  # Identical requests in a batch are only sent once at or below this temperature
+BATCH_POLL_INTERVAL = 30  # Seconds between status checks of an offline batch job
+GENERATION_STOP = ["[[ ## completed ## ]]"]  # DSPy's end-of-output marker - stop generating there instead of paying for trailing commentary
+PROMPT_CACHE_BREAKPOINTS = [{"location": "message", "index": -2}]  # Message before the request's own inputs: the last demo, or the system prompt
 
-# Configure DSPy LLM
-lm = dspy.LM(
-    model=f"openai/{LLM_MODEL_NAME}",
-    api_key=LLM_API_KEY,
-    api_base=LLM_BASE_URL,
-    max_tokens=MAX_TOKENS_GENERATION,  # Increased to prevent truncation
-    temperature=1.7,  # Increased from 0.7 for more creative brainstorming
-)
-dspy.settings.configure(lm=lm)
-
-# Evaluation LLM with different temperature for consistency
-eval_lm = dspy.LM(
-    model=f"openai/{LLM_MODEL_NAME}",
-    api_key=LLM_API_KEY,
-    api_base=LLM_BASE_URL,
-    max_tokens=MAX_TOKENS_EVALUATION,  # Use constant
-    temperature=0.3,  # Increased from 0.1 to reduce repetition
-)
-
-@dataclass
+_CONFIG_KEYS = ("LLM_API_KEY", "LLM_BASE_URL", "LLM_MODEL_NAME")
+
+@cache
+def _load_env() -> None:
+    """Load .env on first use; variables already set in the environment take precedence"""
+    from dotenv import load_dotenv
+    load_dotenv(".env", override=False)
+
+@cache
+def _cfg() -> Dict[str, str]:
+    """LLM connection settings, read on first use"""
+    _load_env()
+    return {key: os.environ[key] for key in _CONFIG_KEYS}
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Read an on/off switch (1/0, true/false, yes/no, on/off) from the environment or .env; invalid values fall back to default"""
+    _load_env()
+    value = os.environ.get(name, "").strip().lower()
+    if not value:
+        return default
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    print(f"⚠️ {name}={value!r} 无效，使用默认值 {'1' if default else '0'}")
+    return default
+
+@cache
+def max_concurrent_llm_calls() -> int:
+    """Upper bound on parallel LLM requests everywhere (optimizer threads, batches, test cases).
+    
+    DSPY_CONCURRENCY (environment or .env) overrides DEFAULT_CONCURRENT_LLM_CALLS; values that
+    aren't positive integers fall back to the default.
+    """
+    _load_env()
+    value = os.environ.get("DSPY_CONCURRENCY", "").strip()
+    if not value:
+        return DEFAULT_CONCURRENT_LLM_CALLS
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        print(f"⚠️ DSPY_CONCURRENCY={value!r} 无效，使用默认值 {DEFAULT_CONCURRENT_LLM_CALLS}")
+        return DEFAULT_CONCURRENT_LLM_CALLS
+    return limit
+
+def __getattr__(name: str):
+    # Keep `from common import LLM_MODEL_NAME` working without reading .env at import time
+    if name in _CONFIG_KEYS:
+        return _cfg()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _prompt_cache_kwargs() -> Dict[str, Any]:
+    """Explicit prompt-cache breakpoint for Claude models; other providers cache shared prefixes automatically"""
+    if 'claude' not in _cfg()['LLM_MODEL_NAME'].lower():
+        return {}
+    # ChatAdapter renders the instructions and demos before the varying inputs, so the whole
+    # conversation up to the final user message is a prefix shared by every request
+    return {'cache_control_injection_points': PROMPT_CACHE_BREAKPOINTS}
+
+@cache
+def _response_cache_enabled() -> bool:
+    """BRAINSTORM_CACHE=0 (environment or .env) turns response replay off, e.g. for fresh optimizer bootstraps"""
+    return env_flag("BRAINSTORM_CACHE", default=True)
+
+@cache
+def get_lm():
+    """Generation LLM, created on first use"""
+    import dspy
+    return dspy.LM(
+        model=f"openai/{_cfg()['LLM_MODEL_NAME']}",
+        api_key=_cfg()["LLM_API_KEY"],
+        api_base=_cfg()["LLM_BASE_URL"],
+        max_tokens=MAX_TOKENS_GENERATION,  # Increased to prevent truncation
+        temperature=1.7,  # Increased from 0.7 for more creative brainstorming
+        stop=GENERATION_STOP,
+        cache=_response_cache_enabled(),
+        **_prompt_cache_kwargs(),
+    )
+
+@cache
+def get_eval_lm():
+    """Evaluation LLM with different temperature for consistency, created on first use"""
+    import dspy
+    return dspy.LM(
+        model=f"openai/{_cfg()['LLM_MODEL_NAME']}",
+        api_key=_cfg()["LLM_API_KEY"],
+        api_base=_cfg()["LLM_BASE_URL"],
+        max_tokens=MAX_TOKENS_EVALUATION,  # Use constant
+        temperature=0.3,  # Increased from 0.1 to reduce repetition
+        cache=_response_cache_enabled(),
+        **_prompt_cache_kwargs(),
+    )
+
+def configure_dspy():
+    """Configure DSPy to use the generation LLM. Entry-point scripts call this once at startup.
+    
+    STRUCTURED_OUTPUT=1 (environment or .env) switches to DSPy's JSONAdapter, which asks the provider
+    for schema-constrained JSON so outputs parse on the first call instead of after a retry. Only
+    enable it for models that support response_format; others pay a rejected request per call.
+    """
+    import dspy
+    lm = get_lm()
+    if env_flag("STRUCTURED_OUTPUT"):
+        dspy.settings.configure(lm=lm, adapter=dspy.JSONAdapter())
+    else:
+        dspy.settings.configure(lm=lm)
+
+class BrainstormGenerationError(RuntimeError):
+    """Raised when a module fails to produce a story idea after retrying; callers may skip the request"""
+
+@dataclass(slots=True, frozen=True)
 class StoryIdea:
     """Data class for a single story idea"""
     title: str
     body: str
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BrainstormRequest:
     """Input parameters for brainstorming"""
     genre: str
     platform: str
     requirements_section: str = ""
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class EvaluationResult:
     """Result from evaluating story ideas"""
     novelty_score: float
@@ -59,40 +159,49 @@ class EvaluationResult:
     genre_score: float  # Changed from genre_consistency_score to match evaluators.py
     engagement_score: float
     overall_score: float
-    feedback: str
+    feedback_sections: Tuple[Tuple[str, float, str], ...] = ()  # (aspect label, score, judge feedback)
+    
+    @property
+    def feedback(self) -> str:
+        """Readable feedback report, built on demand since optimization metrics only need the scores"""
+        if not self.feedback_sections:
+            return ""  # evaluated with build_feedback=False
+        sections = [f"{label}评分：{score}/10\n{text}" for label, score, text in self.feedback_sections]
+        return "\n\n".join(["评估结果详情：", *sections, f"总体评分：{self.overall_score:.1f}/10"])
+
+_CTRL_RE = re.compile(r'[\x00-\x1f\x7f]')
+_WS_RE = re.compile(r'\s+')
+_MD_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.MULTILINE)
+_get_title_body = itemgetter("title", "body")
+# Tokens that drive the JSON bracket scanners: escape sequences, quotes and brackets.
+# Everything else is skipped inside the regex engine instead of one Python iteration per character.
+_JSON_TOKEN_RE = re.compile(r'\\.|["{}\[\]]', re.DOTALL)
 
 def parse_story_ideas(json_response: str) -> List[StoryIdea]:
     """Parse JSON response into StoryIdea objects with improved error handling"""
     try:
         # Clean the response - remove markdown formatting if present
-        cleaned_response = json_response.strip()
-        if cleaned_response.startswith("```json"):
-            cleaned_response = cleaned_response.replace("```json", "").replace("```", "").strip()
-        elif cleaned_response.startswith("```"):
-            cleaned_response = cleaned_response.replace("```", "").strip()
+        cleaned_response = _MD_FENCE_RE.sub('', json_response).strip()
             
-        # Remove control characters that might cause JSON parsing issues
-        # Replace common problematic characters
-        cleaned_response = cleaned_response.replace('\n', ' ').replace('\t', ' ').replace('\r', ' ')
-        # Remove other control characters (ASCII 0-31 except space)
-        cleaned_response = re.sub(r'[\x00-\x1f\x7f]', ' ', cleaned_response)
+        # Remove control characters (ASCII 0-31, including newlines and tabs) that might cause JSON parsing issues
+        cleaned_response = _CTRL_RE.sub(' ', cleaned_response)
         # Normalize multiple spaces to single space
-        cleaned_response = re.sub(r'\s+', ' ', cleaned_response)
+        cleaned_response = _WS_RE.sub(' ', cleaned_response)
         
         # Try to extract JSON from the response using regex if direct parsing fails
         try:
-            ideas_data = json.loads(cleaned_response)
-        except json.JSONDecodeError as e:
+            ideas_data = orjson.loads(cleaned_response)
+        except orjson.JSONDecodeError as e:
             print(f"Initial JSON parsing failed: {e}")
             
             # Check if response appears to be truncated (common issue)
-            if "Unterminated string" in str(e) or cleaned_response.endswith('...'):
+            if "unexpected end of data" in str(e) or cleaned_response.endswith('...'):
                 print("Detected truncated response, attempting to fix...")
                 # Try to fix truncated JSON by finding the last complete object
                 truncated_json = attempt_fix_truncated_json(cleaned_response)
                 if truncated_json:
                     try:
-                        ideas_data = json.loads(truncated_json)
+                        ideas_data = orjson.loads(truncated_json)
                         print("Successfully parsed truncated JSON after repair")
                     except:
                         print("Failed to parse repaired JSON, trying regex extraction")
@@ -106,27 +215,27 @@ def parse_story_ideas(json_response: str) -> List[StoryIdea]:
         if not isinstance(ideas_data, list):
             raise ValueError(f"Expected list, got {type(ideas_data)}")
         
-        ideas = []
-        for i, idea in enumerate(ideas_data):
-            if not isinstance(idea, dict):
-                raise ValueError(f"Idea {i+1} is not a dictionary: {idea}")
-            
-            if "title" not in idea or "body" not in idea:
-                raise KeyError(f"Idea {i+1} missing required fields 'title' or 'body': {idea}")
-            
-            # Clean the title and body text as well
-            title = str(idea["title"]).strip()
-            body = str(idea["body"]).strip()
-            
-            ideas.append(StoryIdea(title=title, body=body))
-        
-        return ideas
+        # Non-dict entries raise TypeError, entries missing 'title' or 'body' raise KeyError
+        return [StoryIdea(str(title).strip(), str(body).strip()) for title, body in map(_get_title_body, ideas_data)]
         
-    except (json.JSONDecodeError, KeyError, ValueError) as e:
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
         print(f"Error parsing story ideas: {e}")
         print(f"Raw response: {json_response[:500]}...")
         return []
 
+# A body runs until the next "[n] 标题:" header, so bracketed numbers inside the story text don't end it
+_INDEXED_IDEA_RE = re.compile(r'\[(\d+)\]\s*标题[:：]\s*(.*?)\s*故事[:：]\s*(.*?)(?=\[\d+\]\s*标题[:：]|$)', re.DOTALL)
+
+def parse_indexed_ideas(batch_response: str) -> List[StoryIdea]:
+    """Parse a batch-prompted response with [index] markers into StoryIdea objects"""
+    ideas = []
+    for _, title, body in _INDEXED_IDEA_RE.findall(batch_response):
+        title = title.strip()
+        body = body.strip()
+        if title and body:
+            ideas.append(StoryIdea(title=title, body=body))
+    return ideas
+
 def attempt_fix_truncated_json(json_text: str) -> str:
     """Attempt to fix truncated JSON by finding the last complete object"""
     try:
@@ -137,30 +246,20 @@ def attempt_fix_truncated_json(json_text: str) -> str:
         # Count braces to find where we have complete objects
         brace_count = 0
         in_string = False
-        escape_next = False
         last_complete_pos = -1
         
-        for i, char in enumerate(json_text):
-            if escape_next:
-                escape_next = False
-                continue
-                
-            if char == '\\':
-                escape_next = True
-                continue
-                
-            if char == '"' and not escape_next:
+        for match in _JSON_TOKEN_RE.finditer(json_text):
+            token = match.group()
+            if token == '"':
                 in_string = not in_string
-                continue
-                
-            if not in_string:
-                if char == '{':
+            elif not in_string:
+                if token == '{':
                     brace_count += 1
-                elif char == '}':
+                elif token == '}':
                     brace_count -= 1
                     if brace_count == 0:
                         # Found end of complete object
-                        last_complete_pos = i + 1
+                        last_complete_pos = match.end()
         
         if last_complete_pos > 0:
             # Extract up to last complete object and close the array
@@ -176,17 +275,40 @@ def attempt_fix_truncated_json(json_text: str) -> str:
     
     return None
 
+def _scan_json_array(text: str) -> Optional[str]:
+    """Return the first balanced JSON array in text using a single pass that skips string contents.
+    
+    If the text ends before the array closes, everything from the opening bracket is returned
+    so the caller can still try to repair it.
+    """
+    start = text.find('[')
+    if start < 0:
+        return None
+    
+    depth = 0
+    in_string = False
+    
+    for match in _JSON_TOKEN_RE.finditer(text, start):
+        token = match.group()
+        if token == '"':
+            in_string = not in_string
+        elif not in_string:
+            if token == '[':
+                depth += 1
+            elif token == ']':
+                depth -= 1
+                if depth == 0:
+                    return text[start:match.end()]
+    
+    return text[start:]
+
 def extract_json_with_regex(cleaned_response: str) -> List:
-    """Extract JSON using regex patterns as fallback"""
-    # Try to find JSON array pattern in the text
-    json_pattern = r'\[.*?\]'
-    matches = re.findall(json_pattern, cleaned_response, re.DOTALL)
-    if matches:
-        # Try parsing the first match
-        json_text = matches[0]
+    """Extract the first JSON array from the response as fallback"""
+    json_text = _scan_json_array(cleaned_response)
+    if json_text:
         # Additional cleaning for the extracted JSON
-        json_text = re.sub(r'[\x00-\x1f\x7f]', ' ', json_text)
-        json_text = re.sub(r'\s+', ' ', json_text)
+        json_text = _CTRL_RE.sub(' ', json_text)
+        json_text = _WS_RE.sub(' ', json_text)
         
         # Try to fix common issues
         if json_text.count('{') > json_text.count('}'):
@@ -196,14 +318,124 @@ def extract_json_with_regex(cleaned_response: str) -> List:
             if not json_text.endswith(']'):
                 json_text += ']'
         
-        return json.loads(json_text)
+        return orjson.loads(json_text)
     else:
         print(f"No JSON array pattern found in response")
         raise json.JSONDecodeError("No valid JSON array found", cleaned_response, 0)
 
-def format_ideas_for_evaluation(ideas: List[StoryIdea]) -> str:
-    """Format story ideas for evaluation"""
-    formatted = ""
-    for i, idea in enumerate(ideas, 1):
-        formatted += f"{i}. 标题: {idea.title}\n   故事: {idea.body}\n\n"
-    return formatted.strip() 
\ No newline at end of file
+def extract_story_idea(prediction) -> Optional[StoryIdea]:
+    """Get the StoryIdea from a module prediction (story_idea attribute or title/body fields)"""
+    story_idea = getattr(prediction, 'story_idea', None)
+    if story_idea is not None:
+        return story_idea
+    if hasattr(prediction, 'title') and hasattr(prediction, 'body'):
+        return StoryIdea(title=prediction.title, body=prediction.body)
+    return None
+
+class RateLimiter:
+    """Thread-safe token bucket allowing requests_per_minute calls, with bursts of up to `burst` calls
+    (max_concurrent_llm_calls() by default, read on the first acquire rather than at import)"""
+    
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None):
+        self.rate = requests_per_minute / 60.0
+        self._burst = burst
+        self.capacity = None
+        self._tokens = 0.0
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.capacity is None:
+                    # First request: start with a full bucket
+                    self.capacity = float(self._burst or max_concurrent_llm_calls())
+                    self._tokens = self.capacity
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# Shared by every LLM call site in the process
+llm_rate_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE)
+
+def cached_predict(predictor, **inputs):
+    """Call a DSPy predictor, letting DSPy's LM cache replay the response when the exact same request was seen before.
+
+    The LM cache keys on the rendered prompt and sampling settings and is kept on disk, so later runs
+    replay responses too, and re-optimized instructions or demos miss it. Callers that want several
+    different samples for the same request use `dspy.context(cache_creative=False)`, which skips the
+    cache for creative sampling (temperature above RESPONSE_CACHE_MAX_TEMPERATURE). Caching can be
+    disabled outright with `dspy.context(cache=False)` or for the whole process with BRAINSTORM_CACHE=0.
+    """
+    import dspy
+    lm = inputs.get('lm') or predictor.lm or dspy.settings.lm
+    temperature = lm.kwargs.get('temperature') or 0.0
+    fresh_sample = temperature > RESPONSE_CACHE_MAX_TEMPERATURE and not dspy.settings.get('cache_creative', True)
+    if not dspy.settings.get('cache', True) or not _response_cache_enabled() or fresh_sample:
+        inputs['config'] = {**inputs.get('config', {}), 'cache': False}
+    llm_rate_limiter.acquire()
+    return predictor(**inputs)
+
+def _batch_client():
+    """OpenAI-compatible client for the Batch API, pointed at the configured provider"""
+    from openai import OpenAI
+    return OpenAI(api_key=_cfg()["LLM_API_KEY"], base_url=_cfg()["LLM_BASE_URL"])
+
+def submit_batch(bodies: List[Dict[str, Any]]) -> str:
+    """Upload chat completion request bodies as one offline batch job and return its batch id.
+    
+    Results are returned keyed by custom_id, which is the body's index in the list.
+    """
+    lines = [
+        json.dumps({"custom_id": str(i), "method": "POST", "url": "/v1/chat/completions", "body": body}, ensure_ascii=False)
+        for i, body in enumerate(bodies)
+    ]
+    client = _batch_client()
+    batch_file = client.files.create(file=("batch.jsonl", "\n".join(lines).encode('utf-8')), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"📦 已提交批量任务 {batch.id}，共 {len(bodies)} 个请求")
+    return batch.id
+
+def poll_batch(batch_id: str, poll_interval: float = BATCH_POLL_INTERVAL):
+    """Block until the batch job reaches a terminal state and return it"""
+    client = _batch_client()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in ("completed", "failed", "expired", "cancelled"):
+            break
+        counts = batch.request_counts
+        if counts:
+            print(f"  ⏳ 批量任务 {batch_id}: {batch.status} ({counts.completed}/{counts.total})")
+        time.sleep(poll_interval)
+    
+    if batch.status != "completed":
+        raise RuntimeError(f"批量任务 {batch_id} 未完成: {batch.status}")
+    return batch
+
+def fetch_batch_results(batch) -> Dict[int, str]:
+    """Download a completed batch's output and map each request index to its completion text"""
+    client = _batch_client()
+    results = {}
+    if not batch.output_file_id:
+        return results
+    
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        record = orjson.loads(line)
+        response = record.get("response") or {}
+        if response.get("status_code") != 200:
+            print(f"  ⚠️ 批量请求 {record.get('custom_id')} 失败: {record.get('error')}")
+            continue
+        results[int(record["custom_id"])] = response["body"]["choices"][0]["message"]["content"]
+    return results
@@ -1,33 +1,52 @@
+import hashlib
+import os
 import numpy as np
 import pandas as pd
 from dspy.datasets.dataset import Dataset
 
+# Local copy of the cleaned dataset, so only the first load pays for the HF download.
+# Files are named by a hash of the source and the label cleaning below, so changing either
+# writes a fresh copy instead of reading a stale one
+DATASET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".dataset_cache")
+DATASET_SOURCE = "hf://datasets/yangwang825/reuters-21578/{}.json"
+LABEL_MAP = {
+  0: "acq",
+  1: "crude",
+  2: "earn",
+  3: "grain",
+  4: "interest",
+  5: "money-fx",
+  6: "ship",
+  7: "trade",
+}
+
+def _dataset_cache_paths() -> tuple[str, str]:
+  """Train and test cache files for the current source and label map"""
+  key = hashlib.blake2b(repr((DATASET_SOURCE, sorted(LABEL_MAP.items()))).encode("utf-8"), digest_size=8).hexdigest()
+  return tuple(os.path.join(DATASET_CACHE_DIR, f"reuters_21578_{key}_{split}.parquet") for split in ("train", "test"))
+
 def read_data_and_subset_to_categories() -> tuple[pd.DataFrame]:
   """
   Read the reuters-21578 dataset. Docs can be found in the url below:
   https://huggingface.co/datasets/yangwang825/reuters-21578
   """
 
+  train_path, test_path = _dataset_cache_paths()
+  if os.path.exists(train_path) and os.path.exists(test_path):
+    return pd.read_parquet(train_path), pd.read_parquet(test_path)
+
   # Read train/test split
-  file_path = "hf://datasets/yangwang825/reuters-21578/{}.json"
-  train = pd.read_json(file_path.format("train"))
-  test = pd.read_json(file_path.format("test"))
-
-  # Clean the labels
-  label_map = {
-      0: "acq",
-      1: "crude",
-      2: "earn",
-      3: "grain",
-      4: "interest",
-      5: "money-fx",
-      6: "ship",
-      7: "trade",
-  }
-
-  train["label"] = train["label"].map(label_map)
-  test["label"] = test["label"].map(label_map)
+  train = pd.read_json(DATASET_SOURCE.format("train"))
+  test = pd.read_json(DATASET_SOURCE.format("test"))
+
+  # Clean the labels; codes outside the map become NaN
+  label_dtype = pd.CategoricalDtype(categories=list(LABEL_MAP.values()))
+  train["label"] = train["label"].map(LABEL_MAP).astype(label_dtype)
+  test["label"] = test["label"].map(LABEL_MAP).astype(label_dtype)
 
+  os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+  train.to_parquet(train_path)
+  test.to_parquet(test_path)
   return train, test
 
 
@@ -47,11 +66,11 @@ class CSVDataset(Dataset):
       train_df, test_df = read_data_and_subset_to_categories()
 
       # Sample for each label
-      train_samples_df = pd.concat(
-          [group.sample(n=self.n_train_per_label) for _, group in train_df.groupby("label")]
+      train_samples_df = train_df.groupby("label", observed=True).sample(
+          n=self.n_train_per_label, random_state=self.train_seed
       )
-      test_samples_df = pd.concat(
-          [group.sample(n=self.n_test_per_label) for _, group in test_df.groupby("label")]
+      test_samples_df = test_df.groupby("label", observed=True).sample(
+          n=self.n_test_per_label, random_state=self.dev_seed
       )
 
       # Set DSPy class variables
@@ -1,231 +1,470 @@
 import dspy
-from typing import List, Dict, Tuple, Optional
-from common import StoryIdea, BrainstormRequest, EvaluationResult, format_ideas_for_evaluation, eval_lm
+from dspy.teleprompt import BootstrapFewShot
+from typing import List, Dict, Any, Tuple, Optional
+from common import (
+    StoryIdea, BrainstormRequest, EvaluationResult, extract_story_idea,
+    get_eval_lm, llm_rate_limiter, max_concurrent_llm_calls,
+    submit_batch, poll_batch, fetch_batch_results
+)
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
-import json
-import pickle
 import os
+import re
+import orjson
+import sqlite3
+import threading
+import queue
+import atexit
+import time
+from collections import OrderedDict
 
-class NoveltyEvaluationSignature(dspy.Signature):
-    """Evaluate novelty and originality of a single story idea"""
+_SCORE_RE = re.compile(r'\d+(?:\.\d+)?')
+
+# Whitespace, punctuation and underscores - ignored when matching near-duplicate ideas in the cache
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+def _normalize_text(text: str) -> str:
+    return _NON_WORD_RE.sub('', text).lower()
+
+def _load_result(data: bytes) -> EvaluationResult:
+    """Rebuild an EvaluationResult from its orjson-serialized cache entry"""
+    fields = orjson.loads(data)
+    fields['feedback_sections'] = tuple(tuple(section) for section in fields['feedback_sections'])
+    return EvaluationResult(**fields)
+
+# Number of evaluation results kept in memory in front of the on-disk cache
+EVALUATION_MEMORY_CACHE_SIZE = 4096
+
+# Background cache writer batching: flush after this many results or this many seconds
+CACHE_FLUSH_BATCH_SIZE = 100
+CACHE_FLUSH_INTERVAL = 1.0
+CACHE_FLUSH_EXIT_TIMEOUT = 10.0  # Seconds interpreter exit waits for queued results to reach disk
+
+# Number of recent (idea, request) results shared between grouped metrics
+GROUP_METRIC_MEMO_SIZE = 1024
+
+# Calibrated judge demos, written once by calibrate_judges() and loaded by every evaluator
+JUDGES_FILE = "judges.json"
+JUDGE_DEMO_COUNT = 3  # Bootstrapped demos kept per judge
+# With calibrated demos showing the scale, the combined judge gets this one-line instruction
+# and only the first clause of each output field's rubric description
+CALIBRATED_JUDGE_INSTRUCTIONS = "Score the story idea on every aspect (1-10) with feedback, on the scale shown in the examples"
+
+# Weights of each evaluation aspect in the overall score (sum to 1.0)
+SCORE_WEIGHTS = {
+    'novelty': 0.18,
+    'feasibility': 0.12,
+    'structure': 0.08,
+    'detail': 0.18,
+    'logical_coherence': 0.16,
+    'genre': 0.10,
+    'engagement': 0.18
+}
+
+# Aspects scored by the per-aspect judge: aspect -> (name, what to assess)
+EVALUATION_ASPECTS = {
+    'novelty': ("新颖性", "评估创意的原创性和避免套路程度，指出创意是否新颖或套路化"),
+    'feasibility': ("拍摄可行性", "考虑成本、场景、演员等因素，分析制作难度和实际约束"),
+    'structure': ("结构明晰度", "评估起承转合的完整性，分析故事结构的清晰度和逻辑性"),
+    'detail': ("详细程度", "评估故事梗概的丰富性、细节描述和情节展开程度，分析创意描述是否充分详细"),
+    'logical_coherence': ("逻辑连贯性", "评估故事内在逻辑、时间线一致性、因果关系合理性，特别关注穿越、重生、多时空等复杂设定的逻辑漏洞，指出逻辑漏洞、时间线矛盾、因果关系不合理等问题"),
+    'genre': ("题材一致性", "评估与指定题材的匹配度，分析是否符合题材特征"),
+    'engagement': ("吸引力", "评估观众兴趣和情感共鸣，分析观众接受度和传播潜力")
+}
+
+# The story inputs come first and in the same order as in the combined judge, so the rendered
+# prompts for every aspect share their leading section for provider prefix caching
+class GenericAspectSignature(dspy.Signature):
+    """Evaluate a single story idea on the given aspect"""
     genre = dspy.InputField(desc="故事题材类型")
+    platform = dspy.InputField(desc="目标平台")
     story_title = dspy.InputField(desc="故事标题")
     story_body = dspy.InputField(desc="故事梗概")
-    novelty_score = dspy.OutputField(desc="新颖性评分(1-10分)，评估创意的原创性和避免套路程度")
-    novelty_feedback = dspy.OutputField(desc="新颖性评价反馈，指出创意是否新颖或套路化")
+    aspect_name = dspy.InputField(desc="评估维度")
+    aspect_description = dspy.InputField(desc="该维度的评估要点")
+    score = dspy.OutputField(desc="该维度的评分(1-10分)")
+    feedback = dspy.OutputField(desc="该维度的评价反馈")
 
-class FeasibilityEvaluationSignature(dspy.Signature):
-    """Evaluate production feasibility of a single story idea"""
+class CombinedEvaluationSignature(dspy.Signature):
+    """Evaluate a single story idea on all aspects at once: novelty, production feasibility, structural clarity, level of detail, logical coherence, genre consistency and engagement potential"""
+    genre = dspy.InputField(desc="故事题材类型")
     platform = dspy.InputField(desc="目标平台")
     story_title = dspy.InputField(desc="故事标题")
     story_body = dspy.InputField(desc="故事梗概")
+    novelty_score = dspy.OutputField(desc="新颖性评分(1-10分)，评估创意的原创性和避免套路程度")
+    novelty_feedback = dspy.OutputField(desc="新颖性评价反馈，指出创意是否新颖或套路化")
     feasibility_score = dspy.OutputField(desc="拍摄可行性评分(1-10分)，考虑成本、场景、演员等因素")
     feasibility_feedback = dspy.OutputField(desc="可行性评价反馈，分析制作难度和实际约束")
-
-class StructureEvaluationSignature(dspy.Signature):
-    """Evaluate structural clarity of a single story idea"""
-    story_title = dspy.InputField(desc="故事标题")
-    story_body = dspy.InputField(desc="故事梗概")
     structure_score = dspy.OutputField(desc="结构明晰度评分(1-10分)，评估起承转合的完整性")
     structure_feedback = dspy.OutputField(desc="结构评价反馈，分析故事结构的清晰度和逻辑性")
-
-class DetailEvaluationSignature(dspy.Signature):
-    """Evaluate the level of detail in a single story idea"""
-    story_title = dspy.InputField(desc="故事标题")
-    story_body = dspy.InputField(desc="故事梗概")
     detail_score = dspy.OutputField(desc="详细程度评分(1-10分)，评估故事梗概的丰富性、细节描述和情节展开程度")
     detail_feedback = dspy.OutputField(desc="详细程度评价反馈，分析创意描述是否充分详细")
-
-class LogicalCoherenceEvaluationSignature(dspy.Signature):
-    """Evaluate logical coherence and internal consistency of a single story idea"""
-    genre = dspy.InputField(desc="故事题材类型")
-    story_title = dspy.InputField(desc="故事标题")
-    story_body = dspy.InputField(desc="故事梗概")
     logical_coherence_score = dspy.OutputField(desc="逻辑连贯性评分(1-10分)，评估故事内在逻辑、时间线一致性、因果关系合理性，特别关注穿越、重生、多时空等复杂设定的逻辑漏洞")
     logical_coherence_feedback = dspy.OutputField(desc="逻辑连贯性评价反馈，指出故事中的逻辑漏洞、时间线矛盾、因果关系不合理等问题")
-
-class GenreConsistencySignature(dspy.Signature):
-    """Evaluate genre consistency of a single story idea"""
-    genre = dspy.InputField(desc="预期的故事题材类型")
-    story_title = dspy.InputField(desc="故事标题")
-    story_body = dspy.InputField(desc="故事梗概")
     genre_score = dspy.OutputField(desc="题材一致性评分(1-10分)，评估与指定题材的匹配度")
     genre_feedback = dspy.OutputField(desc="题材一致性反馈，分析是否符合题材特征")
-
-class EngagementEvaluationSignature(dspy.Signature):
-    """Evaluate engagement potential of a single story idea"""
-    platform = dspy.InputField(desc="目标平台")
-    story_title = dspy.InputField(desc="故事标题")
-    story_body = dspy.InputField(desc="故事梗概")
     engagement_score = dspy.OutputField(desc="吸引力评分(1-10分)，评估观众兴趣和情感共鸣")
     engagement_feedback = dspy.OutputField(desc="吸引力评价反馈，分析观众接受度和传播潜力")
 
+class EvaluationJudges(dspy.Module):
+    """The judge predictors as one program, so calibrated demos can be saved and loaded together"""
+    
+    def __init__(self):
+        super().__init__()
+        self.combined_evaluator = dspy.Predict(CombinedEvaluationSignature)
+        self.aspect_evaluator = dspy.Predict(GenericAspectSignature)
+    
+    def forward(self, genre: str, platform: str, story_title: str, story_body: str) -> dspy.Prediction:
+        """Score one idea with the combined judge (the path calibration bootstraps demos from)"""
+        return self.combined_evaluator(
+            lm=get_eval_lm(),
+            genre=genre,
+            platform=platform,
+            story_title=story_title,
+            story_body=story_body
+        )
+
+def _judgement_is_complete(example, prediction, trace=None) -> bool:
+    """Calibration metric: a judgement only becomes a demo when every aspect score is a number from 1 to 10"""
+    for aspect in SCORE_WEIGHTS:
+        match = _SCORE_RE.search(str(prediction.get(f'{aspect}_score', '')))
+        if match is None or not 1 <= float(match.group()) <= 10:
+            return False
+    return True
+
+def _compact_judge_signature(signature):
+    """Shorten a calibrated judge's prompt: one-line instructions and the first clause of each output description"""
+    signature = signature.with_instructions(CALIBRATED_JUDGE_INSTRUCTIONS)
+    for name, field in signature.output_fields.items():
+        signature = signature.with_updated_fields(name, desc=field.json_schema_extra['desc'].split('，')[0])
+    return signature
+
+def calibrate_judges(pairs: List[Tuple[StoryIdea, BrainstormRequest]], judges_file: str = JUDGES_FILE) -> EvaluationJudges:
+    """Bootstrap few-shot demos for the combined judge from real judgements and save them to judges_file.
+    
+    Run once (python optimize_brainstorm.py --calibrate-judges); evaluators created afterwards load
+    the demos, which show the judge the scoring scale by example, and send a compact prompt.
+    """
+    trainset = [
+        dspy.Example(
+            genre=request.genre,
+            platform=request.platform,
+            story_title=idea.title,
+            story_body=idea.body
+        ).with_inputs('genre', 'platform', 'story_title', 'story_body')
+        for idea, request in pairs
+    ]
+    print(f"⚖️ 校准评审示例 ({len(trainset)} 个创意)...")
+    # The judge has no reference answers, so a demo only has to be a complete, well-formed judgement
+    optimizer = BootstrapFewShot(metric=_judgement_is_complete, max_bootstrapped_demos=JUDGE_DEMO_COUNT, max_labeled_demos=0)
+    judges = optimizer.compile(EvaluationJudges(), trainset=trainset)
+    judges.save(judges_file)
+    print(f"✅ 评审示例已保存: {judges_file} ({len(judges.combined_evaluator.demos)} 个示例)")
+    return judges
+
 class StoryIdeaEvaluator:
     """Comprehensive evaluator for story ideas using multiple LLM judges"""
     
-    def __init__(self, cache_file: str = "evaluation_cache.pkl"):
-        # Configure evaluators to use evaluation LLM
-        with dspy.context(lm=eval_lm):
-            self.novelty_evaluator = dspy.Predict(NoveltyEvaluationSignature)
-            self.feasibility_evaluator = dspy.Predict(FeasibilityEvaluationSignature)
-            self.structure_evaluator = dspy.Predict(StructureEvaluationSignature)
-            self.detail_evaluator = dspy.Predict(DetailEvaluationSignature)
-            self.logical_coherence_evaluator = dspy.Predict(LogicalCoherenceEvaluationSignature)
-            self.genre_evaluator = dspy.Predict(GenreConsistencySignature)
-            self.engagement_evaluator = dspy.Predict(EngagementEvaluationSignature)
+    def __init__(self, cache_file: str = "evaluation_cache.db", use_combined_judge: bool = True, build_feedback: bool = True,
+                 judges_file: str = JUDGES_FILE):
+        # One judge call returning every aspect by default; set use_combined_judge=False
+        # to score each aspect with its own call to the per-aspect judge
+        self.use_combined_judge = use_combined_judge
+        # Optimization metrics only read scores; build_feedback=False drops the judge
+        # feedback text from results and cache entries
+        self.build_feedback = build_feedback
         
-        # Initialize cache
+        # Judges are called with the evaluation LLM passed per call (lm=...); calibrated
+        # demos are loaded when calibrate_judges() has been run
+        self.judges = EvaluationJudges()
+        judges_state = b""
+        if judges_file and os.path.exists(judges_file):
+            with open(judges_file, 'rb') as f:
+                judges_state = f.read()
+            self.judges.load(judges_file)
+            if self.judges.combined_evaluator.demos:
+                self.judges.combined_evaluator.signature = _compact_judge_signature(self.judges.combined_evaluator.signature)
+            print(f"⚖️ 已加载评审示例: {judges_file}")
+        self.combined_evaluator = self.judges.combined_evaluator
+        self.aspect_evaluator = self.judges.aspect_evaluator
+        
+        # Initialize cache; keys cover the loaded judges and the evaluation model, so scores
+        # from before and after calibration (or from another model) are never mixed
+        self._cache_namespace = hashlib.blake2b(judges_state, digest_size=16).hexdigest()
         self.cache_file = cache_file
-        self.cache = self._load_cache()
+        self._cache_lock = threading.Lock()
+        self._cache_db = self._open_cache()
+        # Hot entries stay in memory so repeated examples skip SQLite and unpickling
+        self._memory_cache: OrderedDict[str, EvaluationResult] = OrderedDict()
+        # New results are written to disk by a background thread, off the evaluate() path
+        self._write_queue: queue.Queue = queue.Queue()
+        threading.Thread(target=self._write_loop, name="evaluation-cache-writer", daemon=True).start()
+        atexit.register(self.flush_cache, CACHE_FLUSH_EXIT_TIMEOUT)
     
-    def _load_cache(self) -> Dict[str, EvaluationResult]:
-        """Load evaluation cache from disk"""
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'rb') as f:
-                    return pickle.load(f)
-            except Exception as e:
-                print(f"Warning: Failed to load cache: {e}")
-                return {}
-        return {}
+    def _open_cache(self) -> sqlite3.Connection:
+        """Open the SQLite evaluation cache; WAL mode lets several processes share it"""
+        conn = sqlite3.connect(self.cache_file, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS evaluation_cache (cache_key TEXT PRIMARY KEY, result BLOB NOT NULL)")
+        return conn
     
-    def _save_cache(self):
-        """Save evaluation cache to disk"""
+    def _cache_get(self, cache_key: str) -> Optional[EvaluationResult]:
+        """Look up a cached evaluation result, in memory first and then on disk"""
+        with self._cache_lock:
+            result = self._memory_cache.get(cache_key)
+            if result is not None:
+                self._memory_cache.move_to_end(cache_key)
+                return result
+            row = self._cache_db.execute(
+                "SELECT result FROM evaluation_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+        if row is None:
+            return None
         try:
-            with open(self.cache_file, 'wb') as f:
-                pickle.dump(self.cache, f)
+            result = _load_result(row[0])
         except Exception as e:
-            print(f"Warning: Failed to save cache: {e}")
+            print(f"Warning: Failed to load cached result: {e}")
+            return None
+        self._remember(cache_key, result)
+        return result
+    
+    def _remember(self, cache_key: str, result: EvaluationResult):
+        """Add a result to the in-memory LRU, evicting the least recently used entry when full"""
+        with self._cache_lock:
+            self._memory_cache[cache_key] = result
+            self._memory_cache.move_to_end(cache_key)
+            if len(self._memory_cache) > EVALUATION_MEMORY_CACHE_SIZE:
+                self._memory_cache.popitem(last=False)
+    
+    def _cache_put(self, cache_key: str, result: EvaluationResult):
+        """Store an evaluation result in memory now and queue it for the background disk write"""
+        self._remember(cache_key, result)
+        self._write_queue.put((cache_key, orjson.dumps(result)))
+    
+    def _write_loop(self):
+        """Background writer: commit queued results in batches of up to CACHE_FLUSH_BATCH_SIZE,
+        waiting at most CACHE_FLUSH_INTERVAL seconds for a batch to fill"""
+        while True:
+            rows = [self._write_queue.get()]
+            deadline = time.monotonic() + CACHE_FLUSH_INTERVAL
+            while len(rows) < CACHE_FLUSH_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(self._write_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                with self._cache_lock:
+                    self._cache_db.execute("BEGIN")
+                    self._cache_db.executemany(
+                        "INSERT OR REPLACE INTO evaluation_cache (cache_key, result) VALUES (?, ?)", rows
+                    )
+                    self._cache_db.execute("COMMIT")
+            except Exception as e:
+                # Keep the writer alive: a dead writer would leave the queue undrained and flush_cache waiting
+                print(f"Warning: Failed to save cache: {e}")
+                try:
+                    if self._cache_db.in_transaction:
+                        self._cache_db.execute("ROLLBACK")
+                except sqlite3.Error as rollback_error:
+                    print(f"Warning: Failed to roll back cache write: {rollback_error}")
+            finally:
+                for _ in rows:
+                    self._write_queue.task_done()
+    
+    def flush_cache(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued result has been written to disk, or until timeout seconds have passed.
+        
+        Returns whether the queue was drained. Also runs at interpreter exit, with CACHE_FLUSH_EXIT_TIMEOUT.
+        """
+        # Queue.join() has no timeout, so wait on the condition it uses
+        with self._write_queue.all_tasks_done:
+            return self._write_queue.all_tasks_done.wait_for(lambda: not self._write_queue.unfinished_tasks, timeout)
     
     def _get_cache_key(self, ideas: List[StoryIdea], request: BrainstormRequest) -> str:
         """Generate a cache key for the given ideas and request"""
-        content = {
-            'ideas': [{'title': idea.title, 'body': idea.body} for idea in ideas],
-            'genre': request.genre,
-            'platform': request.platform,
-            'requirements': request.requirements_section
-        }
-        content_str = json.dumps(content, sort_keys=True, ensure_ascii=False)
-        return hashlib.md5(content_str.encode('utf-8')).hexdigest()
+        # Feed fields straight into the hash instead of building a JSON string first;
+        # separator bytes keep field boundaries unambiguous
+        h = hashlib.blake2b(digest_size=16)
+        for field in (self._cache_namespace, get_eval_lm().model, request.genre, request.platform, request.requirements_section):
+            h.update(field.encode('utf-8'))
+            h.update(b'\x1f')
+        for idea in ideas:
+            h.update(b'\x1e')
+            h.update(idea.title.encode('utf-8'))
+            h.update(b'\x1f')
+            h.update(idea.body.encode('utf-8'))
+        return h.hexdigest()
+    
+    def _get_normalized_cache_key(self, ideas: List[StoryIdea], request: BrainstormRequest) -> str:
+        """Cache key that ignores whitespace, punctuation, letter case and idea order"""
+        normalized = sorted((_normalize_text(idea.title), _normalize_text(idea.body)) for idea in ideas)
+        normalized_ideas = [StoryIdea(title=title, body=body) for title, body in normalized]
+        return "normalized:" + self._get_cache_key(normalized_ideas, request)
+    
+    def _lookup_cached(self, ideas: List[StoryIdea], request: BrainstormRequest) -> Tuple[Optional[EvaluationResult], List[str]]:
+        """Return a cached result (exact match first, then near-duplicate) and the keys to store a new result under"""
+        cache_keys = [self._get_cache_key(ideas, request), self._get_normalized_cache_key(ideas, request)]
+        
+        result = self._cache_get(cache_keys[0])
+        if self._is_usable(result):
+            print("  📋 使用缓存的评估结果")
+            return result, cache_keys
+        
+        result = self._cache_get(cache_keys[1])
+        if self._is_usable(result):
+            print("  📋 使用近似创意的缓存评估结果")
+            return result, cache_keys
+        return None, cache_keys
+    
+    def _is_usable(self, result: Optional[EvaluationResult]) -> bool:
+        """Whether a cached result can be returned; entries cached without feedback don't serve evaluators that report it"""
+        return result is not None and (bool(result.feedback_sections) or not self.build_feedback)
     
     def evaluate(self, idea: StoryIdea, request: BrainstormRequest) -> EvaluationResult:
         """Comprehensive evaluation of a single story idea with caching"""
         
         # Check cache first
-        cache_key = self._get_cache_key([idea], request)
-        if cache_key in self.cache:
-            print("  📋 使用缓存的评估结果")
-            return self.cache[cache_key]
+        cached_result, cache_keys = self._lookup_cached([idea], request)
+        if cached_result is not None:
+            return cached_result
         
         # Use evaluation LLM for all evaluations
-        with dspy.context(lm=eval_lm):
-            # Evaluate novelty
-            novelty_result = self.novelty_evaluator(
+        if self.use_combined_judge:
+            # Single call; the combined prediction carries every aspect's score and feedback
+            llm_rate_limiter.acquire()
+            judged = self.judges(
                 genre=request.genre,
-                story_title=idea.title,
-                story_body=idea.body
-            )
-            
-            # Evaluate feasibility
-            feasibility_result = self.feasibility_evaluator(
                 platform=request.platform,
                 story_title=idea.title,
                 story_body=idea.body
             )
+        else:
+            judged = {}
+            for aspect, aspect_result in self._run_aspect_judges(idea, request).items():
+                judged[f'{aspect}_score'] = aspect_result.score
+                judged[f'{aspect}_feedback'] = aspect_result.feedback
+        
+        result = self._build_result(judged)
+        
+        # Cache the result
+        for cache_key in cache_keys:
+            self._cache_put(cache_key, result)
+        
+        return result
+
+    def evaluate_many(self, pairs: List[Tuple[StoryIdea, BrainstormRequest]]) -> List[EvaluationResult]:
+        """Evaluate many (idea, request) pairs concurrently, returning results in pair order.
+        
+        Each pair goes through evaluate(), so cached results are reused and the judges run as DSPy
+        predictors: the LM cache, its retries on rate limits and MLflow eval tracing all apply.
+        """
+        if not pairs:
+            return []
+        print(f"  📦 并发评估 {len(pairs)} 个创意")
+        with ThreadPoolExecutor(max_workers=min(max_concurrent_llm_calls(), len(pairs))) as executor:
+            return list(executor.map(lambda pair: self.evaluate(*pair), pairs))
+    
+    def evaluate_batch_offline(self, pairs: List[Tuple[StoryIdea, BrainstormRequest]]) -> List[EvaluationResult]:
+        """Evaluate many (idea, request) pairs through the provider's Batch API (cheaper, but may take hours).
+        
+        Meant for warming the cache before an optimization run; failed requests are re-evaluated in real time.
+        """
+        return self._evaluate_pairs(pairs, self._complete_offline)
+    
+    def _evaluate_pairs(self, pairs: List[Tuple[StoryIdea, BrainstormRequest]], complete) -> List[EvaluationResult]:
+        """Evaluate uncached pairs with the combined judge, sending the rendered prompts through `complete`"""
+        results: List[Optional[EvaluationResult]] = [None] * len(pairs)
+        pending = []
+        for i, (idea, request) in enumerate(pairs):
+            results[i], cache_keys = self._lookup_cached([idea], request)
+            if results[i] is None:
+                pending.append((i, cache_keys))
+        
+        if pending:
+            print(f"  📦 批量评估 {len(pending)} 个创意 (缓存命中 {len(pairs) - len(pending)} 个)")
+            adapter = dspy.settings.adapter or dspy.ChatAdapter()
+            signature = self.combined_evaluator.signature
+            messages = [
+                adapter.format(
+                    signature,
+                    demos=self.combined_evaluator.demos,
+                    inputs={
+                        'genre': pairs[i][1].genre,
+                        'platform': pairs[i][1].platform,
+                        'story_title': pairs[i][0].title,
+                        'story_body': pairs[i][0].body
+                    }
+                )
+                for i, _ in pending
+            ]
+            completions = complete(messages)
             
-            # Evaluate structure
-            structure_result = self.structure_evaluator(
-                story_title=idea.title,
-                story_body=idea.body
-            )
-            
-            # Evaluate detail level
-            detail_result = self.detail_evaluator(
-                story_title=idea.title,
-                story_body=idea.body
-            )
-            
-            # Evaluate logical coherence
-            logical_coherence_result = self.logical_coherence_evaluator(
-                genre=request.genre,
-                story_title=idea.title,
-                story_body=idea.body
-            )
-            
-            # Evaluate genre consistency
-            genre_result = self.genre_evaluator(
-                genre=request.genre,
-                story_title=idea.title,
-                story_body=idea.body
-            )
-            
-            # Evaluate engagement
-            engagement_result = self.engagement_evaluator(
-                platform=request.platform,
-                story_title=idea.title,
-                story_body=idea.body
-            )
+            for (i, cache_keys), completion in zip(pending, completions):
+                idea, request = pairs[i]
+                try:
+                    if completion is None:
+                        raise ValueError("no completion returned")
+                    judged = adapter.parse(signature, completion)
+                    result = self._build_result(judged)
+                except Exception as e:
+                    print(f"  ⚠️ 批量评估结果无效，单独重新评估: {e}")
+                    results[i] = self.evaluate(idea, request)
+                    continue
+                for cache_key in cache_keys:
+                    self._cache_put(cache_key, result)
+                results[i] = result
         
+        return results
+    
+    def _complete_offline(self, messages: List[List[Dict[str, Any]]]) -> List[Optional[str]]:
+        """Send the prompts as one Batch API job and wait for it to finish"""
+        from common import LLM_MODEL_NAME  # read on use so importing evaluators doesn't load .env
+        lm_kwargs = {k: v for k, v in get_eval_lm().kwargs.items() if k in ('temperature', 'max_tokens')}
+        bodies = [{'model': LLM_MODEL_NAME, 'messages': m, **lm_kwargs} for m in messages]
+        completions = fetch_batch_results(poll_batch(submit_batch(bodies)))
+        return [completions.get(i) for i in range(len(messages))]
+    
+    def _build_result(self, judged) -> EvaluationResult:
+        """Turn judge outputs (mapping of <aspect>_score / <aspect>_feedback fields) into an EvaluationResult"""
         # Parse scores (handle potential parsing errors)
-        novelty_score = self._parse_score(novelty_result.novelty_score)
-        feasibility_score = self._parse_score(feasibility_result.feasibility_score)
-        structure_score = self._parse_score(structure_result.structure_score)
-        detail_score = self._parse_score(detail_result.detail_score)
-        logical_coherence_score = self._parse_score(logical_coherence_result.logical_coherence_score)
-        genre_score = self._parse_score(genre_result.genre_score)
-        engagement_score = self._parse_score(engagement_result.engagement_score)
+        novelty_score = self._parse_score(judged['novelty_score'])
+        feasibility_score = self._parse_score(judged['feasibility_score'])
+        structure_score = self._parse_score(judged['structure_score'])
+        detail_score = self._parse_score(judged['detail_score'])
+        logical_coherence_score = self._parse_score(judged['logical_coherence_score'])
+        genre_score = self._parse_score(judged['genre_score'])
+        engagement_score = self._parse_score(judged['engagement_score'])
         
         # Calculate weighted overall score
-        weights = {
-            'novelty': 0.18,
-            'feasibility': 0.12,
-            'structure': 0.08,
-            'detail': 0.18,
-            'logical_coherence': 0.16,
-            'genre': 0.10,
-            'engagement': 0.18
-        }
-        
         overall_score = (
-            novelty_score * weights['novelty'] +
-            feasibility_score * weights['feasibility'] +
-            structure_score * weights['structure'] +
-            detail_score * weights['detail'] +
-            logical_coherence_score * weights['logical_coherence'] +
-            genre_score * weights['genre'] +
-            engagement_score * weights['engagement']
+            novelty_score * SCORE_WEIGHTS['novelty'] +
+            feasibility_score * SCORE_WEIGHTS['feasibility'] +
+            structure_score * SCORE_WEIGHTS['structure'] +
+            detail_score * SCORE_WEIGHTS['detail'] +
+            logical_coherence_score * SCORE_WEIGHTS['logical_coherence'] +
+            genre_score * SCORE_WEIGHTS['genre'] +
+            engagement_score * SCORE_WEIGHTS['engagement']
         )
         
-        # Combine feedback
-        combined_feedback = f"""
-评估结果详情：
-
-新颖性评分：{novelty_score}/10
-{novelty_result.novelty_feedback}
-
-可行性评分：{feasibility_score}/10
-{feasibility_result.feasibility_feedback}
-
-结构评分：{structure_score}/10
-{structure_result.structure_feedback}
-
-详细程度评分：{detail_score}/10
-{detail_result.detail_feedback}
-
-逻辑连贯性评分：{logical_coherence_score}/10
-{logical_coherence_result.logical_coherence_feedback}
-
-题材一致性评分：{genre_score}/10
-{genre_result.genre_feedback}
-
-吸引力评分：{engagement_score}/10
-{engagement_result.engagement_feedback}
-
-总体评分：{overall_score:.1f}/10
-"""
+        # Keep the feedback parts; the report text is only assembled if someone reads it
+        if self.build_feedback:
+            feedback_sections = (
+                ('新颖性', novelty_score, judged['novelty_feedback']),
+                ('可行性', feasibility_score, judged['feasibility_feedback']),
+                ('结构', structure_score, judged['structure_feedback']),
+                ('详细程度', detail_score, judged['detail_feedback']),
+                ('逻辑连贯性', logical_coherence_score, judged['logical_coherence_feedback']),
+                ('题材一致性', genre_score, judged['genre_feedback']),
+                ('吸引力', engagement_score, judged['engagement_feedback'])
+            )
+        else:
+            feedback_sections = ()
         
-        # Create result
-        result = EvaluationResult(
+        return EvaluationResult(
             overall_score=overall_score,
             novelty_score=novelty_score,
             feasibility_score=feasibility_score,
@@ -234,29 +473,41 @@ class StoryIdeaEvaluator:
             logical_coherence_score=logical_coherence_score,
             genre_score=genre_score,
             engagement_score=engagement_score,
-            feedback=combined_feedback.strip()
+            feedback_sections=feedback_sections
         )
+    
+    def _run_aspect_judges(self, idea: StoryIdea, request: BrainstormRequest) -> Dict[str, dspy.Prediction]:
+        """Score every aspect concurrently with the per-aspect judge, returning predictions keyed by aspect"""
+        inputs = {
+            'genre': request.genre,
+            'platform': request.platform,
+            'story_title': idea.title,
+            'story_body': idea.body
+        }
         
-        # Cache the result
-        self.cache[cache_key] = result
-        self._save_cache()
+        # The LLM is passed per call, so worker threads don't depend on thread-local DSPy settings
+        lm = get_eval_lm()
         
-        return result
-
+        def run(aspect_name: str, aspect_description: str):
+            llm_rate_limiter.acquire()
+            return self.aspect_evaluator(lm=lm, **inputs, aspect_name=aspect_name, aspect_description=aspect_description)
+        
+        with ThreadPoolExecutor(max_workers=min(max_concurrent_llm_calls(), len(EVALUATION_ASPECTS))) as executor:
+            futures = {
+                aspect: executor.submit(run, name, description)
+                for aspect, (name, description) in EVALUATION_ASPECTS.items()
+            }
+            return {aspect: future.result() for aspect, future in futures.items()}
+    
     def _parse_score(self, score_str: str) -> float:
         """Parse score string, handling various formats"""
         if isinstance(score_str, (int, float)):
-            return float(score_str)
+            return min(max(float(score_str), 0.0), 10.0)  # Clamp to 0-10 range
         
         # Try to extract number from string
-        import re
-        matches = re.findall(r'(\d+(?:\.\d+)?)', str(score_str))
-        if matches:
-            try:
-                score = float(matches[0])
-                return min(max(score, 0.0), 10.0)  # Clamp to 0-10 range
-            except ValueError:
-                pass
+        match = _SCORE_RE.search(str(score_str))
+        if match:
+            return min(max(float(match.group()), 0.0), 10.0)  # Clamp to 0-10 range
         
         print(f"Warning: Could not parse score '{score_str}', defaulting to 5.0")
         return 5.0
@@ -279,6 +530,23 @@ class GroupedEvaluationMetrics:
         self.single_group = {
             'overall': ['novelty', 'feasibility', 'structure', 'detail', 'logical_coherence', 'genre', 'engagement']
         }
+        
+        # Each group metric scores the same (idea, request) pairs; evaluate each pair once for all groups
+        self._results: OrderedDict[Tuple[StoryIdea, BrainstormRequest], EvaluationResult] = OrderedDict()
+        self._results_lock = threading.Lock()
+    
+    def _evaluate_once(self, idea: StoryIdea, request: BrainstormRequest) -> EvaluationResult:
+        """Evaluate an idea, reusing the result another group metric already computed for it"""
+        key = (idea, request)
+        with self._results_lock:
+            result = self._results.get(key)
+        if result is None:
+            result = self.evaluator.evaluate(idea, request)
+            with self._results_lock:
+                self._results[key] = result
+                if len(self._results) > GROUP_METRIC_MEMO_SIZE:
+                    self._results.popitem(last=False)
+        return result
     
     def create_group_metric(self, group_name: str, metric_names: List[str]):
         """Create a metric function for a specific group of evaluation criteria"""
@@ -286,21 +554,9 @@ class GroupedEvaluationMetrics:
             """Metric function for a specific group - simplified for single idea evaluation"""
             try:
                 # Extract single idea from prediction
-                idea = None
-                
-                if hasattr(prediction, 'story_idea'):
-                    # DSPy prediction with story_idea attribute
-                    idea = prediction.story_idea
-                elif hasattr(prediction, 'title') and hasattr(prediction, 'body'):
-                    # DSPy prediction with title/body attributes
-                    from common import StoryIdea
-                    idea = StoryIdea(title=prediction.title, body=prediction.body)
-                else:
-                    print(f"Warning: Unexpected prediction type: {type(prediction)}")
-                    return 0.0
-                
+                idea = extract_story_idea(prediction)
                 if not idea:
-                    print(f"Warning: No idea extracted from prediction")
+                    print(f"Warning: No idea extracted from prediction of type {type(prediction)}")
                     return 0.0
                 
                 # Create request from example
@@ -310,8 +566,8 @@ class GroupedEvaluationMetrics:
                     requirements_section=getattr(example, 'requirements_section', '')
                 )
                 
-                # Evaluate single idea
-                result = self.evaluator.evaluate(idea, request)
+                # Evaluate single idea (shared across group metrics)
+                result = self._evaluate_once(idea, request)
                 
                 # Calculate group score
                 if group_name == 'overall':
@@ -3,13 +3,22 @@
 Utilities for inspecting optimized DSPy modules and prompts
 """
 
-import json
 import os
+import orjson
+from datetime import datetime
 from typing import Dict, Any, List
-import dspy
-from brainstorm_module import BrainstormModule
-from common import BrainstormRequest, StoryIdea
-import pandas as pd
+from common import BrainstormRequest, extract_story_idea, configure_dspy
+
+# dspy is imported only where a module is executed; inspecting and saving prompts of an
+# already-built module doesn't need it, so importing this file stays cheap
+
+def _preview(text: str, width: int) -> str:
+    """Truncate text for console output, adding an ellipsis only when something was cut"""
+    return text if len(text) <= width else f"{text[:width]}..."
+
+def _demo_fields(demo) -> Dict[str, Any]:
+    """Read a demo's fields without copying the module; demos restored by module.load() are plain dicts rather than Examples"""
+    return demo if isinstance(demo, dict) else demo.toDict()
 
 def inspect_optimized_module(optimized_module, name: str = "optimized_module"):
     """Inspect the optimized DSPy module to see what changed"""
@@ -22,15 +31,18 @@ def inspect_optimized_module(optimized_module, name: str = "optimized_module"):
         print(f"Predictor类型: {type(predictor).__name__}")
         
         # Check if it's a few-shot predictor with demos
-        if hasattr(predictor, 'demos'):
-            print(f"\n📚 Few-shot demonstrations: {len(predictor.demos)} 个示例")
-            for i, demo in enumerate(predictor.demos):
+        demos = tuple(getattr(predictor, 'demos', ()))
+        if demos:
+            print(f"\n📚 Few-shot demonstrations: {len(demos)} 个示例")
+            for i, demo in enumerate(demos):
+                fields = _demo_fields(demo)
                 print(f"\n  示例 {i+1}:")
-                print(f"    题材: {demo.genre}")
-                print(f"    平台: {demo.platform}")
-                print(f"    要求: {demo.requirements_section[:50]}...")
-                if hasattr(demo, 'title') and hasattr(demo, 'body'):
-                    print(f"    创意: 【{demo.title}】{demo.body[:100]}...")
+                print(f"    题材: {fields.get('genre')}")
+                print(f"    平台: {fields.get('platform')}")
+                print(f"    要求: {_preview(fields.get('requirements_section', ''), 50)}")
+                title, body = fields.get('title'), fields.get('body')
+                if title is not None and body is not None:
+                    print(f"    创意: 【{title}】{_preview(body, 100)}")
         else:
             print("\n📚 无 Few-shot demonstrations")
         
@@ -63,7 +75,7 @@ def save_optimized_prompts(module, name: str) -> str:
     module_info = {
         "name": name,
         "type": type(module).__name__,
-        "timestamp": str(pd.Timestamp.now()) if 'pd' in globals() else "unknown"
+        "timestamp": datetime.now().isoformat()
     }
     
     if hasattr(module, 'generate_idea'):
@@ -77,14 +89,15 @@ def save_optimized_prompts(module, name: str) -> str:
         if hasattr(predictor, 'demos'):
             demos_data = []
             for demo in predictor.demos:
+                fields = _demo_fields(demo)
                 demo_dict = {
-                    'genre': demo.genre,
-                    'platform': demo.platform,
-                    'requirements_section': getattr(demo, 'requirements_section', ''),
+                    'genre': fields.get('genre'),
+                    'platform': fields.get('platform'),
+                    'requirements_section': fields.get('requirements_section', ''),
                 }
-                if hasattr(demo, 'title') and hasattr(demo, 'body'):
-                    demo_dict['title'] = demo.title
-                    demo_dict['body'] = demo.body
+                if 'title' in fields and 'body' in fields:
+                    demo_dict['title'] = fields['title']
+                    demo_dict['body'] = fields['body']
                 demos_data.append(demo_dict)
             predictor_info['demos'] = demos_data
             predictor_info['num_demos'] = len(demos_data)
@@ -108,19 +121,21 @@ def save_optimized_prompts(module, name: str) -> str:
     
     # Save to file
     filename = f"{prompts_dir}/{name}_optimized_prompts.json"
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(module_info, f, ensure_ascii=False, indent=2)
+    with open(filename, 'wb') as f:
+        f.write(orjson.dumps(module_info, option=orjson.OPT_INDENT_2))
     
     print(f"✅ 优化后的提示词信息已保存到: {filename}")
     return filename
 
-def trace_module_execution(module, request: BrainstormRequest, name: str = "module"):
-    """Trace the execution of a module to see actual prompts used"""
+def trace_module_execution(module, request: BrainstormRequest, name: str = "module", collect_trace: bool = False):
+    """Run a module on one request; with collect_trace=True also print the DSPy execution trace"""
+    import dspy
     print(f"🔍 追踪模块执行过程: {name}")
     print("-" * 40)
     
-    # Enable DSPy history tracking
-    with dspy.context(trace=[]):
+    # Predict appends every call to settings.trace unless it is None, and the process-wide default
+    # list is never cleared, so record into a fresh list only when the trace is printed
+    with dspy.context(trace=[] if collect_trace else None):
         try:
             # Generate a single idea for tracing
             prediction = module(
@@ -129,20 +144,21 @@ def trace_module_execution(module, request: BrainstormRequest, name: str = "modu
                 requirements_section=request.requirements_section
             )
             # Extract StoryIdea from DSPy prediction
-            idea = prediction.story_idea if hasattr(prediction, 'story_idea') else StoryIdea(title=prediction.title, body=prediction.body)
+            idea = extract_story_idea(prediction)
             ideas = [idea]  # Convert to list for compatibility
             
             # Get the execution trace
-            if dspy.settings.trace:
-                print("📋 执行追踪:")
-                for i, trace_item in enumerate(dspy.settings.trace):
-                    print(f"  步骤 {i+1}: {trace_item}")
-            else:
-                print("⚠️  无执行追踪信息")
+            if collect_trace:
+                if dspy.settings.trace:
+                    print("📋 执行追踪:")
+                    for i, trace_item in enumerate(dspy.settings.trace):
+                        print(f"  步骤 {i+1}: {trace_item}")
+                else:
+                    print("⚠️  无执行追踪信息")
             
             print(f"\n✅ 生成了 {len(ideas)} 个创意")
             for i, idea in enumerate(ideas, 1):
-                print(f"  {i}. 【{idea.title}】{idea.body[:50]}...")
+                print(f"  {i}. 【{idea.title}】{_preview(idea.body, 50)}")
             
             return ideas
             
@@ -150,16 +166,16 @@ def trace_module_execution(module, request: BrainstormRequest, name: str = "modu
             print(f"❌ 执行追踪失败: {e}")
             return []
 
-def compare_baseline_vs_optimized(baseline_module, optimized_module, test_request: BrainstormRequest):
-    """Compare baseline vs optimized module responses"""
+def compare_baseline_vs_optimized(baseline_module, optimized_module, test_request: BrainstormRequest, collect_trace: bool = False):
+    """Compare baseline vs optimized module responses (collect_trace=True also prints each execution trace)"""
     print("🆚 基础模型 vs 优化模型对比")
     print("=" * 50)
     
     print("🔸 基础模型响应:")
-    baseline_ideas = trace_module_execution(baseline_module, test_request, "基础模型")
+    baseline_ideas = trace_module_execution(baseline_module, test_request, "基础模型", collect_trace)
     
     print(f"\n🔹 优化模型响应:")
-    optimized_ideas = trace_module_execution(optimized_module, test_request, "优化模型")
+    optimized_ideas = trace_module_execution(optimized_module, test_request, "优化模型", collect_trace)
     
     print(f"\n📊 对比结果:")
     print(f"  基础模型创意数量: {len(baseline_ideas)}")
@@ -194,21 +210,23 @@ def extract_prompt_templates(module) -> Dict[str, Any]:
         if hasattr(predictor, 'demos') and predictor.demos:
             templates['few_shot_examples'] = []
             for demo in predictor.demos:
+                fields = _demo_fields(demo)
                 example = {
                     'input': {
-                        'genre': demo.genre,
-                        'platform': demo.platform,
-                        'requirements_section': getattr(demo, 'requirements_section', '')
+                        'genre': fields.get('genre'),
+                        'platform': fields.get('platform'),
+                        'requirements_section': fields.get('requirements_section', '')
                     }
                 }
-                if hasattr(demo, 'title') and hasattr(demo, 'body'):
-                    example['output'] = {'title': demo.title, 'body': demo.body}
+                if 'title' in fields and 'body' in fields:
+                    example['output'] = {'title': fields['title'], 'body': fields['body']}
                 templates['few_shot_examples'].append(example)
     
     return templates
 
 def main():
     """Demo function showing how to use the inspection utilities"""
+    from brainstorm_module import BrainstormModule
     print("🔧 DSPy 模块检查工具演示")
     print("=" * 50)
     
@@ -224,4 +242,5 @@ def main():
     # compare_baseline_vs_optimized(baseline_module, optimized_module, test_request)
 
 if __name__ == "__main__":
+    configure_dspy()
     main() 
\ No newline at end of file
@@ -6,21 +6,33 @@ Supports both flat (single-group) and grouped optimization approaches
 Uses golden examples from /examples directory for high-quality training data
 """
 
-import mlflow
 import sys
+import hashlib
 import json
 import os
-from copy import copy
-from typing import List, Dict, Tuple
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import List, Dict, Tuple, Optional
 from datetime import datetime
 import dspy
-from dspy.teleprompt import MIPROv2
+import litellm
+import numpy as np
+import orjson
+from dspy.utils.exceptions import AdapterParseError
 
 from brainstorm_module import BrainstormModule
-from evaluators import StoryIdeaEvaluator, create_evaluation_metric, create_grouped_evaluation_metrics
-from common import BrainstormRequest, StoryIdea, LLM_MODEL_NAME
+from brainstorm_data import SYNTHETIC_TRAINING_EXAMPLES
+from evaluators import StoryIdeaEvaluator, create_evaluation_metric, create_grouped_evaluation_metrics, calibrate_judges, JUDGES_FILE, SCORE_WEIGHTS
+from common import StoryIdea, BrainstormRequest, BrainstormGenerationError, max_concurrent_llm_calls, extract_story_idea, configure_dspy, env_flag, _response_cache_enabled
 from inspect_optimized_prompts import inspect_optimized_module, save_optimized_prompts
 
+# mlflow (and its tracking stack) and the MIPROv2 optimizer are imported where they are used, so
+# the training-data and evaluation helpers can be imported without loading them
+
 # CONFIGURATION: Set optimization mode
 # Options: "flat" (current approach - single overall metric) or "grouped" (separate group optimization)
 OPTIMIZATION_MODE = "flat"  # Change this to "grouped" to use grouped optimization
@@ -28,6 +40,42 @@ OPTIMIZATION_MODE = "flat"  # Change this to "grouped" to use grouped optimizati
 # CONFIGURATION: Number of test examples to evaluate (reduce for faster optimization)
 MAX_TEST_EXAMPLES = 2  # Reduced from 5 to speed up evaluation
 
+# CONFIGURATION: Grouped mode logs the model artifact only for its best group; SAVE_ALL_MODELS=1 logs every group's.
+# Like the switches below it is read on use, from the environment or .env
+SAVE_ALL_MODELS_ENV = "SAVE_ALL_MODELS"
+
+# CONFIGURATION: MLFLOW_DSPY_TRACE_COMPILE=1 opts in to MLflow traces for every LM call made during optimizer compiles
+# (mlflow.dspy.autolog leaves them off by default)
+TRACE_COMPILE_ENV = "MLFLOW_DSPY_TRACE_COMPILE"
+
+# Input example logged with every saved model
+MLFLOW_INPUT_EXAMPLE = {
+    "genre": "都市爱情",
+    "platform": "抖音",
+    "requirements_section": "浪漫甜蜜的爱情故事"
+}
+
+# CONFIGURATION: Compiled modules are reused across runs with the same training data and optimizer config
+# (BRAINSTORM_CACHE=0 recompiles, like it resamples LLM responses)
+COMPILE_CACHE_DIR = ".compile_cache"
+
+# Detailed score aspects reported per model (EvaluationResult has a <name>_score field for each)
+METRIC_NAMES = tuple(SCORE_WEIGHTS)
+
+# CONFIGURATION: Idea generation retries (exponential backoff with jitter, capped)
+GENERATION_MAX_ATTEMPTS = 3
+GENERATION_RETRY_MAX_DELAY = 60  # seconds
+# Only malformed output and transient provider failures are worth another LLM round-trip;
+# anything else (a bug, bad credentials, an oversized prompt) fails the same way again
+RETRYABLE_GENERATION_ERRORS = (
+    AdapterParseError, json.JSONDecodeError, TimeoutError, ConnectionError,
+    litellm.RateLimitError, litellm.Timeout, litellm.APIConnectionError,
+    litellm.InternalServerError, litellm.ServiceUnavailableError, litellm.BadGatewayError
+)
+
+class BrainstormOptimizationError(RuntimeError):
+    """Raised when an optimization, evaluation or save step fails; grouped runs skip the failed group and keep the rest"""
+
 
 
 # Global variables for logging
@@ -41,6 +89,7 @@ class ComprehensiveLogger:
         self.base_dir = base_dir
         self.run_dir = None
         self.step_counter = 0
+        self._step_lock = threading.Lock()  # Steps may be logged from worker threads
         self.setup_logging_directories()
     
     def setup_logging_directories(self):
@@ -167,14 +216,16 @@ class ComprehensiveLogger:
     
     def log_optimization_step(self, step_name: str, data: Dict, step_type: str = "general"):
         """Log optimization step with details"""
-        self.step_counter += 1
-        step_dir = os.path.join(self.run_dir, "03_optimization_process", f"step_{self.step_counter:02d}_{step_name}")
+        with self._step_lock:
+            self.step_counter += 1
+            step_number = self.step_counter
+        step_dir = os.path.join(self.run_dir, "03_optimization_process", f"step_{step_number:02d}_{step_name}")
         os.makedirs(step_dir, exist_ok=True)
         
         # Save step data
         step_file = os.path.join(step_dir, "step_data.json")
         step_data = {
-            "step_number": self.step_counter,
+            "step_number": step_number,
             "step_name": step_name,
             "step_type": step_type,
             "timestamp": datetime.now().isoformat(),
@@ -187,7 +238,7 @@ class ComprehensiveLogger:
         # Save step summary
         summary_file = os.path.join(step_dir, "step_summary.txt")
         with open(summary_file, 'w', encoding='utf-8') as f:
-            f.write(f"Optimization Step {self.step_counter}: {step_name}\n")
+            f.write(f"Optimization Step {step_number}: {step_name}\n")
             f.write("=" * 50 + "\n")
             f.write(f"Step type: {step_type}\n")
             f.write(f"Timestamp: {datetime.now()}\n\n")
@@ -200,7 +251,7 @@ class ComprehensiveLogger:
                 else:
                     f.write(f"  {key}: {type(value).__name__}\n")
         
-        print(f"📝 优化步骤 {self.step_counter} 已记录: {step_name}")
+        print(f"📝 优化步骤 {step_number} 已记录: {step_name}")
         return step_dir
     
     def log_evaluation_results(self, results: Dict, test_name: str):
@@ -344,13 +395,17 @@ class ComprehensiveLogger:
 logger = ComprehensiveLogger()
 
 def load_golden_examples() -> List[dspy.Example]:
-    """Load golden examples from /examples directory"""
+    """Load golden examples from /examples directory (read once per process)"""
+    return list(_load_golden_examples())
+
+@lru_cache(maxsize=1)
+def _load_golden_examples() -> Tuple[dspy.Example, ...]:
     examples_dir = "src/examples"
     golden_examples = []
     
     if not os.path.exists(examples_dir):
         print(f"❌ 黄金样例目录不存在: {examples_dir}")
-        return []
+        return ()
     
     # Platform mapping for different genres
     platform_mapping = {
@@ -417,54 +472,18 @@ def load_golden_examples() -> List[dspy.Example]:
                 continue
     
     print(f"✅ 成功加载 {len(golden_examples)} 个黄金样例")
-    return golden_examples
+    return tuple(golden_examples)
 
 def create_synthetic_training_examples() -> List[dspy.Example]:
     """Create diverse synthetic training examples for optimization using real genre system"""
-    examples_data = [
-        # 女频 - 爱情类
-        {"genre": "甜宠", "platform": "抖音", "requirements_section": "浪漫甜蜜的爱情故事，适合年轻观众"},
-        {"genre": "虐恋", "platform": "小红书", "requirements_section": "充满波折、痛苦和情感挣扎的爱情故事"},
-        {"genre": "霸总", "platform": "快手", "requirements_section": "高冷型霸道总裁，节奏紧凑"},
-        
-        # 女频 - 设定类
-        {"genre": "穿越", "platform": "抖音", "requirements_section": "身穿或魂穿，古代现代背景都可"},
-        {"genre": "重生", "platform": "小红书", "requirements_section": "重生题材，复仇或改变命运"},
-        {"genre": "马甲", "platform": "快手", "requirements_section": "多重身份设定，反转惊喜"},
-        {"genre": "替身", "platform": "抖音", "requirements_section": "真假千金，双胞胎替换"},
-        
-        # 女频 - 其他类型
-        {"genre": "萌宝", "platform": "小红书", "requirements_section": "可爱萌娃，温馨家庭"},
-        {"genre": "团宠", "platform": "快手", "requirements_section": "被全家宠爱的设定"},
-        {"genre": "娱乐圈", "platform": "抖音", "requirements_section": "娱乐圈背景，明星生活"},
-        
-        # 男频 - 设定类
-        {"genre": "玄幻", "platform": "快手", "requirements_section": "修炼成仙，升级打怪"},
-        {"genre": "末世", "platform": "抖音", "requirements_section": "末日求生，丧尸题材，制作成本可控"},
-        
-        # 男频 - 逆袭类
-        {"genre": "战神", "platform": "小红书", "requirements_section": "强者归来，兵王题材"},
-        {"genre": "神豪", "platform": "抖音", "requirements_section": "一夜暴富，点石成金"},
-        {"genre": "赘婿", "platform": "快手", "requirements_section": "赘婿逆袭，扮猪吃老虎"},
-        {"genre": "逆袭", "platform": "小红书", "requirements_section": "小人物成长，马甲大佬"},
-        {"genre": "金手指", "platform": "抖音", "requirements_section": "超能力，系统选中"},
-        {"genre": "高手下山", "platform": "快手", "requirements_section": "隐世高手重出江湖"},
-        
-        # 男频 - 其他类型
-        {"genre": "神医", "platform": "小红书", "requirements_section": "医术高超，悬壶济世"},
-    ]
-    
-    # Create DSPy examples and configure with proper input fields
-    configured_examples = []
-    for data in examples_data:
-        example = dspy.Example(**data)
-        configured_example = example.with_inputs("genre", "platform", "requirements_section")
-        configured_examples.append(configured_example)
-    
-    return configured_examples
+    return list(SYNTHETIC_TRAINING_EXAMPLES)
 
 def create_training_examples() -> List[dspy.Example]:
-    """Create combined training examples using both golden examples and synthetic examples"""
+    """Create combined training examples using both golden examples and synthetic examples (built once per process)"""
+    return list(_create_training_examples())
+
+@lru_cache(maxsize=1)
+def _create_training_examples() -> Tuple[dspy.Example, ...]:
     print("📚 加载训练样例...")
     
     # Load golden examples first
@@ -474,54 +493,149 @@ def create_training_examples() -> List[dspy.Example]:
     synthetic_examples = create_synthetic_training_examples()
     
     # Combine them, prioritizing golden examples
-    all_examples = golden_examples + synthetic_examples
+    all_examples = _dedup(golden_examples + synthetic_examples)
     
     print(f"📊 训练样例统计:")
     print(f"  - 黄金样例: {len(golden_examples)} 个")
     print(f"  - 合成样例: {len(synthetic_examples)} 个") 
     print(f"  - 总计: {len(all_examples)} 个")
     
-    return all_examples
+    return tuple(all_examples)
+
+def _dedup(examples: List[dspy.Example]) -> List[dspy.Example]:
+    """Drop examples whose inputs repeat an earlier example's, keeping first-seen order.
+    
+    Every training example costs bootstrap/evaluation LLM calls during compile, and a repeated
+    request only pays for the same work again.
+    """
+    unique = {}
+    for example in examples:
+        unique.setdefault((example.genre, example.platform, example.requirements_section), example)
+    return list(unique.values())
+
+# Genres each optimization group trains on (golden examples are always included)
+GROUP_GENRES = {
+    # Focus on genres that require high creativity and engagement
+    "creativity": frozenset(["穿越", "重生", "马甲", "替身", "玄幻", "末世", "金手指", "复仇"]),
+    # Focus on practical, cost-effective genres
+    "feasibility": frozenset(["甜宠", "霸总", "萌宝", "团宠", "娱乐圈", "神医"]),
+    # Focus on genres requiring detailed storytelling and logical coherence
+    "content_quality": frozenset(["虐恋", "穿越", "重生", "战神", "逆袭", "高手下山", "复仇"]),
+}
+
+# MIPROv2 seed for each optimization group; fixed values keep grouped runs reproducible across processes
+GROUP_SEEDS = {"creativity": 43, "feasibility": 57, "content_quality": 71, "overall": 42}
 
 def create_group_specific_training_examples(group_name: str) -> List[dspy.Example]:
     """Create training examples tailored for specific evaluation groups"""
+    return list(_create_group_specific_training_examples(group_name))
+
+@lru_cache(maxsize=None)
+def _create_group_specific_training_examples(group_name: str) -> Tuple[dspy.Example, ...]:
+    """Build a group's training set once per process"""
     # First get all examples (golden + synthetic)
     base_examples = create_training_examples()
     
+    genres = GROUP_GENRES.get(group_name)
+    if genres is None:
+        # Return all examples for overall/flat optimization
+        return tuple(base_examples)
+    
     # Always include golden examples as they are high-quality
-    golden_examples = load_golden_examples()
+    filtered_examples = [ex for ex in base_examples if ex.genre in genres]
+    return tuple(_dedup(load_golden_examples() + filtered_examples))
+
+@lru_cache(maxsize=1)
+def _get_evaluator() -> StoryIdeaEvaluator:
+    """The evaluator shared by optimization metrics and test evaluation (one cache connection and judge load).
     
-    if group_name == "creativity":
-        # Focus on genres that require high creativity and engagement
-        creative_genres = ["穿越", "重生", "马甲", "替身", "玄幻", "末世", "金手指", "复仇"]
-        filtered_examples = [ex for ex in base_examples if ex.genre in creative_genres]
-        # Always include golden examples for creativity training
-        return golden_examples + filtered_examples
-    elif group_name == "feasibility":
-        # Focus on practical, cost-effective genres
-        practical_genres = ["甜宠", "霸总", "萌宝", "团宠", "娱乐圈", "神医"]
-        filtered_examples = [ex for ex in base_examples if ex.genre in practical_genres]
-        return golden_examples + filtered_examples
-    elif group_name == "content_quality":
-        # Focus on genres requiring detailed storytelling and logical coherence
-        quality_genres = ["虐恋", "穿越", "重生", "战神", "逆袭", "高手下山", "复仇"]
-        filtered_examples = [ex for ex in base_examples if ex.genre in quality_genres]
-        # Golden examples are especially important for content quality
-        return golden_examples + filtered_examples
-    else:
-        # Return all examples for overall/flat optimization
-        return base_examples
+    Both only read scores, so judge feedback is not built. The evaluator is thread-safe, so
+    optimizer threads and the test-case pool can share it.
+    """
+    return StoryIdeaEvaluator(build_feedback=False)
 
-def generate_single_idea(module, request: BrainstormRequest):
-    """Generate a single idea using DSPy module - pure DSPy approach"""
-    prediction = module(
-        genre=request.genre,
-        platform=request.platform,
-        requirements_section=request.requirements_section
+def _compile_cache_path(base_module, train_examples: List[dspy.Example], config: Dict) -> str:
+    """Where the compile result for this student, training set, optimizer config, model and judges is saved"""
+    from common import LLM_MODEL_NAME  # read on use so importing this module doesn't load .env
+    judges = b""
+    if os.path.exists(JUDGES_FILE):
+        with open(JUDGES_FILE, 'rb') as f:
+            judges = f.read()
+    content = orjson.dumps({
+        "student": base_module.dump_state(),
+        "examples": [example.toDict() for example in train_examples],
+        "config": config,
+        "model": LLM_MODEL_NAME,
+        "judges": hashlib.blake2b(judges, digest_size=16).hexdigest()
+    }, option=orjson.OPT_SORT_KEYS, default=str)
+    key = hashlib.blake2b(content, digest_size=16).hexdigest()
+    return os.path.join(COMPILE_CACHE_DIR, f"{key}.json")
+
+def compile_with_cache(optimizer, base_module, train_examples: List[dspy.Example], config: Dict) -> dspy.Module:
+    """Compile base_module with the optimizer, or load the saved result of an identical earlier compile"""
+    # Same switch (environment or .env) as the LM response cache
+    use_cache = _response_cache_enabled()
+    path = _compile_cache_path(base_module, train_examples, config)
+    if use_cache and os.path.exists(path):
+        compiled_module = base_module.deepcopy()
+        compiled_module.load(path)
+        # load() restores demos as plain dicts; turn them back into Examples like a fresh compile
+        for predictor in compiled_module.predictors():
+            predictor.demos = [dspy.Example(**demo) if isinstance(demo, dict) else demo for demo in predictor.demos]
+        print(f"♻️ 复用已缓存的编译结果: {path}")
+        return compiled_module
+    
+    compiled_module = optimizer.compile(
+        base_module,
+        trainset=train_examples,
+        requires_permission_to_run=False
     )
+    if use_cache:
+        os.makedirs(COMPILE_CACHE_DIR, exist_ok=True)
+        compiled_module.save(path)
+    return compiled_module
+
+def _is_retryable(error: BaseException) -> bool:
+    """Whether a generation failure is transient; DSPy's adapter fallback wraps the original error, so check its causes too"""
+    while error is not None:
+        if isinstance(error, RETRYABLE_GENERATION_ERRORS):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+def generate_single_idea(module, request: BrainstormRequest):
+    """Generate a single idea using DSPy module - pure DSPy approach.
     
-    # Extract StoryIdea from DSPy prediction
-    idea = prediction.story_idea if hasattr(prediction, 'story_idea') else StoryIdea(title=prediction.title, body=prediction.body)
+    Malformed output and transient provider errors are retried with exponential backoff;
+    raises BrainstormGenerationError once GENERATION_MAX_ATTEMPTS attempts have failed.
+    Any other exception is raised immediately. Retries bypass the LM cache, which would
+    otherwise replay the same malformed completion.
+    """
+    for attempt in range(GENERATION_MAX_ATTEMPTS):
+        try:
+            with dspy.context(cache=False) if attempt else nullcontext():
+                prediction = module(
+                    genre=request.genre,
+                    platform=request.platform,
+                    requirements_section=request.requirements_section
+                )
+        except Exception as e:
+            if not _is_retryable(e):
+                raise
+            error = e
+        else:
+            # Extract StoryIdea from DSPy prediction
+            idea = extract_story_idea(prediction)
+            if idea is not None:
+                break
+            error = ValueError(f"预测结果中没有故事创意: {type(prediction)}")
+        
+        if attempt == GENERATION_MAX_ATTEMPTS - 1:
+            raise BrainstormGenerationError(f"{request.genre} 创意生成失败 ({GENERATION_MAX_ATTEMPTS} 次尝试): {error}") from error
+        # Back off so retries don't pile onto a rate-limited or struggling provider
+        delay = min(GENERATION_RETRY_MAX_DELAY, 2 ** attempt + random.random())
+        print(f"  ⚠️ 创意生成失败，{delay:.1f} 秒后重试 ({attempt + 1}/{GENERATION_MAX_ATTEMPTS}): {error}")
+        time.sleep(delay)
     
     # Log successful generation
     logger.log_optimization_step("idea_generation_success", {
@@ -534,8 +648,39 @@ def generate_single_idea(module, request: BrainstormRequest):
     
     return idea
 
+def create_judge_calibration_pairs() -> List[Tuple[StoryIdea, BrainstormRequest]]:
+    """Generate one idea per synthetic example with the unoptimized module, for calibrating the judges.
+    
+    Ideas go through generate_single_idea, so malformed output is retried; examples that still
+    fail are left out rather than aborting the calibration.
+    """
+    requests = [
+        BrainstormRequest(
+            genre=example.genre,
+            platform=example.platform,
+            requirements_section=example.requirements_section
+        )
+        for example in create_synthetic_training_examples()
+    ]
+    module = BrainstormModule()
+    # DSPy settings are thread-local, so hand the caller's LM to every worker thread
+    lm = dspy.settings.lm
+    
+    def generate(request: BrainstormRequest) -> Optional[StoryIdea]:
+        with dspy.context(lm=lm):
+            try:
+                return generate_single_idea(module, request)
+            except BrainstormGenerationError as e:
+                print(f"  ⚠️ 跳过校准样例 {request.genre}: {e}")
+                return None
+    
+    with ThreadPoolExecutor(max_workers=min(max_concurrent_llm_calls(), len(requests))) as executor:
+        ideas = list(executor.map(generate, requests))
+    return [(idea, request) for idea, request in zip(ideas, requests) if idea is not None]
+
 def run_flat_optimization(auto_mode: str = "medium") -> Tuple[dspy.Module, List[dspy.Example]]:
     """Run flat (single-group) optimization - current approach"""
+    from dspy.teleprompt import MIPROv2
     print(f"🚀 开始平面优化 (模式: {auto_mode}) - 所有指标统一优化")
     print("=" * 60)
     
@@ -544,7 +689,7 @@ def run_flat_optimization(auto_mode: str = "medium") -> Tuple[dspy.Module, List[
         logger.log_optimization_step("flat_optimization_start", {
             "auto_mode": auto_mode,
             "max_bootstrapped_demos": 4,
-            "num_threads": 8,
+            "num_threads": max_concurrent_llm_calls(),
             "max_labeled_demos": 4,
             "seed": 42
         }, "optimization_start")
@@ -560,7 +705,7 @@ def run_flat_optimization(auto_mode: str = "medium") -> Tuple[dspy.Module, List[
             logger.log_golden_examples(golden_examples)
         
         # Create evaluator and metric (single overall metric)
-        evaluator = StoryIdeaEvaluator()
+        evaluator = _get_evaluator()
         metric = create_evaluation_metric(evaluator)  # This uses the overall score
         
         logger.log_optimization_step("metric_creation", {
@@ -569,11 +714,19 @@ def run_flat_optimization(auto_mode: str = "medium") -> Tuple[dspy.Module, List[
         }, "configuration")
         
         # Configure MIPROv2 optimizer
+        optimizer_config = {
+            "optimizer": "MIPROv2",
+            "mode": "flat",
+            "auto": auto_mode,
+            "max_bootstrapped_demos": 4,
+            "max_labeled_demos": 4,
+            "seed": 42
+        }
         optimizer = MIPROv2(
             metric=metric,
             auto=auto_mode,
             max_bootstrapped_demos=4,
-            num_threads=8,
+            num_threads=max_concurrent_llm_calls(),
             max_labeled_demos=4,
             verbose=True,
             track_stats=True,
@@ -594,11 +747,7 @@ def run_flat_optimization(auto_mode: str = "medium") -> Tuple[dspy.Module, List[
             "base_module_type": "BrainstormModule"
         }, "compilation")
         
-        compiled_module = optimizer.compile(
-            base_module, 
-            trainset=train_examples,
-            requires_permission_to_run=False
-        )
+        compiled_module = compile_with_cache(optimizer, base_module, train_examples, optimizer_config)
         
         logger.log_optimization_step("module_compilation_complete", {
             "compiled_module_type": str(type(compiled_module)),
@@ -614,68 +763,94 @@ def run_flat_optimization(auto_mode: str = "medium") -> Tuple[dspy.Module, List[
     except Exception as e:
         logger.log_error(e, "flat_optimization")
         print(f"❌ 平面优化过程中发生错误: {e}")
-        print("停止执行")
-        sys.exit(1)
+        raise BrainstormOptimizationError(f"平面优化失败: {e}") from e
 
 def run_grouped_optimization(auto_mode: str = "medium") -> Tuple[Dict[str, dspy.Module], List[dspy.Example]]:
     """Run grouped optimization - separate optimization for different evaluation aspects"""
+    from dspy.teleprompt import MIPROv2
     print(f"🚀 开始分组优化 (模式: {auto_mode}) - 分别优化不同评估维度")
     print("=" * 60)
     
     try:
         # Create evaluator and grouped metrics
-        evaluator = StoryIdeaEvaluator()
+        evaluator = _get_evaluator()
         grouped_metrics = create_grouped_evaluation_metrics(evaluator, use_single_group=False)
         
         optimized_modules = {}
         all_training_examples = []
         
-        for group_name, metric in grouped_metrics.items():
-            print(f"\n📊 优化组别: {group_name}")
-            print("-" * 40)
-            
-            # Create group-specific or shared training examples
-            if group_name in ["creativity", "feasibility", "content_quality"]:
-                train_examples = create_group_specific_training_examples(group_name)
-                print(f"  使用 {len(train_examples)} 个针对性训练样例")
-            else:
-                train_examples = create_training_examples()
-                print(f"  使用 {len(train_examples)} 个通用训练样例")
-            
-            all_training_examples.extend(train_examples)
-            
-            # Configure optimizer for this group
+        # MIPROv2 compiles a deep copy of the student, so every group can start from the same module
+        base_module = BrainstormModule()
+        
+        # The group compiles are independent and bound by LLM latency, so run them concurrently in
+        # threads: they share llm_rate_limiter, the evaluator and the response caches, which separate
+        # processes would each duplicate. The thread budget is split between the groups.
+        threads_per_group = max(1, max_concurrent_llm_calls() // len(grouped_metrics))
+        
+        def optimize_group(group_name: str, metric, train_examples: List[dspy.Example]) -> dspy.Module:
+            """Compile the module for one group"""
             optimizer = MIPROv2(
                 metric=metric,
                 auto=auto_mode,
                 max_bootstrapped_demos=3,  # Slightly fewer demos per group
-                num_threads=6,
+                num_threads=threads_per_group,
                 max_labeled_demos=3,
                 verbose=True,
                 track_stats=True,
-                seed=42 + hash(group_name) % 100  # Different seed per group
+                seed=GROUP_SEEDS.get(group_name, 42)  # Different seed per group
             )
             
             print(f"  开始优化 {group_name} 组...")
             
-            # Compile module for this group
-            base_module = BrainstormModule()
-            compiled_module = optimizer.compile(
-                base_module,
-                trainset=train_examples,
-                requires_permission_to_run=False
-            )
-            
-            optimized_modules[group_name] = compiled_module
+            optimizer_config = {
+                "optimizer": "MIPROv2",
+                "mode": "grouped",
+                "group": group_name,
+                "auto": auto_mode,
+                "max_bootstrapped_demos": 3,
+                "max_labeled_demos": 3,
+                "seed": GROUP_SEEDS.get(group_name, 42)
+            }
+            return compile_with_cache(optimizer, base_module, train_examples, optimizer_config)
+        
+        futures = {}
+        with ThreadPoolExecutor(max_workers=len(grouped_metrics)) as executor:
+            for group_name, metric in grouped_metrics.items():
+                print(f"\n📊 优化组别: {group_name}")
+                print("-" * 40)
+                
+                # Create group-specific or shared training examples
+                if group_name in GROUP_GENRES:
+                    train_examples = create_group_specific_training_examples(group_name)
+                    print(f"  使用 {len(train_examples)} 个针对性训练样例")
+                else:
+                    train_examples = create_training_examples()
+                    print(f"  使用 {len(train_examples)} 个通用训练样例")
+                
+                all_training_examples.extend(train_examples)
+                futures[group_name] = executor.submit(optimize_group, group_name, metric, train_examples)
+        
+        # A failed group shouldn't discard the groups that compiled
+        for group_name, future in futures.items():
+            try:
+                optimized_modules[group_name] = future.result()
+            except Exception as e:
+                logger.log_error(e, f"grouped_optimization_{group_name}")
+                print(f"  ⚠️ {group_name} 组优化失败，跳过: {e}")
+                continue
             print(f"  ✅ {group_name} 组优化完成!")
         
+        if not optimized_modules:
+            raise BrainstormOptimizationError("所有分组优化均失败")
+        
         print(f"\n✅ 所有分组优化完成! 共优化了 {len(optimized_modules)} 个组别")
-        return optimized_modules, list(set(all_training_examples))  # Remove duplicates
+        return optimized_modules, _dedup(all_training_examples)  # Remove duplicates
         
+    except BrainstormOptimizationError:
+        raise
     except Exception as e:
         print(f"❌ 分组优化过程中发生错误: {e}")
-        print("停止执行")
-        sys.exit(1)
+        raise BrainstormOptimizationError(f"分组优化失败: {e}") from e
 
 def evaluate_model_performance(module, test_examples: List[dspy.Example], name: str) -> Tuple[float, Dict[str, float]]:
     """Evaluate model performance on test examples, return overall score and detailed scores"""
@@ -689,175 +864,201 @@ def evaluate_model_performance(module, test_examples: List[dspy.Example], name:
         "evaluation_limit": 5
     }, "evaluation")
     
-    evaluator = StoryIdeaEvaluator()
-    total_scores = []
-    detailed_scores = {
-        'novelty': [], 'feasibility': [], 'structure': [], 
-        'detail': [], 'logical_coherence': [], 'genre': [], 'engagement': []
-    }
+    evaluator = _get_evaluator()
+    # Running sums of the detailed scores; averaged over the scored cases at the end
+    detailed_sums = dict.fromkeys(METRIC_NAMES, 0.0)
     
     test_cases_results = []
+    generation_failures = 0
     
-    for i, example in enumerate(test_examples[:MAX_TEST_EXAMPLES]):
+    def generate_case(i: int, example: dspy.Example) -> Tuple[StoryIdea, BrainstormRequest]:
+        """Generate the idea for one test case"""
+        request = BrainstormRequest(
+            genre=example.genre,
+            platform=example.platform,
+            requirements_section=example.requirements_section
+        )
+        
+        # Generate single idea using DSPy; test ideas are fixed samples replayed from
+        # DSPy's LM cache, so re-evaluating an unchanged module skips generation
+        idea = generate_single_idea(module, request)
+        
+        # Log generated example for this test case
+        idea_as_string = f"{idea.title}: {idea.body}"
+        logger.log_generated_examples([idea_as_string], f"{name}_case_{i+1}_{example.genre}")
+        return idea, request
+    
+    # Test cases are independent and bound by LLM latency, so generate them concurrently
+    test_cases = test_examples[:MAX_TEST_EXAMPLES]
+    total_scores = np.full(len(test_cases), np.nan)  # NaN marks skipped cases
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrent_llm_calls(), len(test_cases)))) as executor:
+        futures = [executor.submit(generate_case, i, example) for i, example in enumerate(test_cases)]
+    
+    # Per-case console lines are collected and printed in case order, in one write, once grading is done
+    report = {}
+    generated = {}
+    for i, future in enumerate(futures):
         try:
-            request = BrainstormRequest(
-                genre=example.genre,
-                platform=example.platform,
-                requirements_section=example.requirements_section
-            )
-            
-            # Generate single idea using DSPy
-            idea = generate_single_idea(module, request)
-            
-            # Log generated example for this test case
-            idea_as_string = f"{idea.title}: {idea.body}"
-            logger.log_generated_examples([idea_as_string], f"{name}_case_{i+1}_{example.genre}")
-            
-            # Evaluate
-            result = evaluator.evaluate(idea, request)
-            total_scores.append(result.overall_score)
-            
-            # Collect detailed scores
-            detailed_scores['novelty'].append(result.novelty_score)
-            detailed_scores['feasibility'].append(result.feasibility_score)
-            detailed_scores['structure'].append(result.structure_score)
-            detailed_scores['detail'].append(result.detail_score)
-            detailed_scores['logical_coherence'].append(result.logical_coherence_score)
-            detailed_scores['genre'].append(result.genre_score)
-            detailed_scores['engagement'].append(result.engagement_score)
-            
-            # Store test case result for logging
-            test_case_result = {
-                "case_number": i + 1,
-                "genre": example.genre,
-                "platform": example.platform,
-                "requirements": example.requirements_section,
-                "generated_idea": {"title": idea.title, "body": idea.body},
-                "overall_score": result.overall_score,
-                "detailed_scores": {
-                    "novelty": result.novelty_score,
-                    "feasibility": result.feasibility_score,
-                    "structure": result.structure_score,
-                    "detail": result.detail_score,
-                    "logical_coherence": result.logical_coherence_score,
-                    "genre": result.genre_score,
-                    "engagement": result.engagement_score
-                }
-            }
-            test_cases_results.append(test_case_result)
-            
-            print(f"  案例 {i+1} ({example.genre}): {result.overall_score:.1f}/10")
-            
+            generated[i] = future.result()
+        except BrainstormGenerationError as e:
+            # One failed generation shouldn't throw away the rest of the run; skip the case
+            generation_failures += 1
+            logger.log_error(e, f"evaluate_model_performance_case_{i+1}")
+            report[i] = f"  ⚠️ 案例 {i+1} 生成失败，跳过: {e}"
+            continue
         except Exception as e:
             logger.log_error(e, f"evaluate_model_performance_case_{i+1}")
-            print(f"  ❌ 案例 {i+1} 评估失败: {e}")
-            print("停止执行")
-            sys.exit(1)
+            report[i] = f"  ❌ 案例 {i+1} 评估失败: {e}"
+            print("\n".join(report[case] for case in sorted(report)))
+            raise BrainstormOptimizationError(f"{name} 案例 {i+1} 评估失败: {e}") from e
     
-    if total_scores:
-        avg_score = sum(total_scores) / len(total_scores)
+    # Grade every generated idea together; evaluate_many runs the judges concurrently
+    try:
+        results = evaluator.evaluate_many(list(generated.values())) if generated else []
+    except Exception as e:
+        logger.log_error(e, "evaluate_model_performance_grading")
+        print("\n".join(report[case] for case in sorted(report)))
+        raise BrainstormOptimizationError(f"{name} 评估失败: {e}") from e
+    
+    for (i, (idea, _)), result in zip(generated.items(), results):
+        example = test_cases[i]
+        total_scores[i] = result.overall_score
+        
+        # Collect detailed scores
+        for metric_name in detailed_sums:
+            detailed_sums[metric_name] += getattr(result, f"{metric_name}_score")
+        
+        # Store test case result for logging
+        test_case_result = {
+            "case_number": i + 1,
+            "genre": example.genre,
+            "platform": example.platform,
+            "requirements": example.requirements_section,
+            "generated_idea": {"title": idea.title, "body": idea.body},
+            "overall_score": result.overall_score,
+            "detailed_scores": {metric_name: getattr(result, f"{metric_name}_score") for metric_name in METRIC_NAMES}
+        }
+        test_cases_results.append(test_case_result)
+        
+        report[i] = f"  案例 {i+1} ({example.genre}): {result.overall_score:.1f}/10"
+    
+    if report:
+        print("\n".join(report[case] for case in sorted(report)))
+    
+    valid_scores = total_scores[~np.isnan(total_scores)]
+    if valid_scores.size:
+        avg_score = float(valid_scores.mean())
+        score_std = float(valid_scores.std())
         
         # Calculate average detailed scores
-        avg_detailed_scores = {}
-        for metric_name, scores in detailed_scores.items():
-            if scores:
-                avg_detailed_scores[metric_name] = sum(scores) / len(scores)
-            else:
-                avg_detailed_scores[metric_name] = 0.0
+        avg_detailed_scores = {metric_name: total / valid_scores.size for metric_name, total in detailed_sums.items()}
         
         # Log evaluation results
         evaluation_results = {
             "model_name": name,
             "overall_score": avg_score,
+            "score_std": score_std,
             "detailed_scores": avg_detailed_scores,
             "test_cases": test_cases_results,
-            "total_test_cases": len(test_cases_results)
+            "total_test_cases": len(test_cases_results),
+            "generation_failures": generation_failures
         }
         logger.log_evaluation_results(evaluation_results, f"evaluation_{name}")
         
-        print(f"\n  平均分数: {avg_score:.1f}/10")
-        print(f"  详细分数:")
-        for metric_name, score in avg_detailed_scores.items():
-            print(f"    {metric_name}: {score:.1f}/10")
+        summary = [f"\n  平均分数: {avg_score:.1f}/10 (标准差 {score_std:.2f})", "  详细分数:"]
+        summary.extend(f"    {metric_name}: {score:.1f}/10" for metric_name, score in avg_detailed_scores.items())
+        print("\n".join(summary))
         
         return avg_score, avg_detailed_scores
     else:
         print("  ❌ 无有效评估结果")
-        sys.exit(1)
+        raise BrainstormOptimizationError(f"{name} 无有效评估结果")
 
-def evaluate_grouped_models(grouped_modules: Dict[str, dspy.Module], test_examples: List[dspy.Example]) -> Tuple[float, Dict[str, float]]:
-    """Evaluate grouped models and average their scores"""
+def evaluate_grouped_models(grouped_modules: Dict[str, dspy.Module], test_examples: List[dspy.Example]) -> Tuple[float, Dict[str, float], Dict[str, Tuple[float, Dict[str, float]]]]:
+    """Evaluate grouped models and average their scores.
+    
+    Also returns each evaluated group's (overall score, detailed scores), so callers can log
+    per-group results without evaluating again.
+    """
     print(f"\n📊 评估分组优化模型性能")
     print("-" * 40)
     
-    group_scores = {}
-    group_detailed_scores = {}
+    group_results = {}
     
-    # Evaluate each group
-    for group_name, module in grouped_modules.items():
-        overall_score, detailed_scores = evaluate_model_performance(module, test_examples, f"分组-{group_name}")
-        group_scores[group_name] = overall_score
-        group_detailed_scores[group_name] = detailed_scores
+    # Groups are independent and bound by LLM latency, so evaluate them concurrently
+    # (llm_rate_limiter keeps the combined request rate within budget)
+    with ThreadPoolExecutor(max_workers=max(1, len(grouped_modules))) as executor:
+        futures = {
+            group_name: executor.submit(evaluate_model_performance, module, test_examples, f"分组-{group_name}")
+            for group_name, module in grouped_modules.items()
+        }
+    
+    # A group that can't be evaluated is left out of the average
+    for group_name, future in futures.items():
+        try:
+            group_results[group_name] = future.result()
+        except BrainstormOptimizationError as e:
+            print(f"  ⚠️ {group_name} 组评估失败，跳过: {e}")
     
     # Calculate averaged final score
-    if group_scores:
-        final_avg_score = sum(group_scores.values()) / len(group_scores)
+    if group_results:
+        final_avg_score = sum(score for score, _ in group_results.values()) / len(group_results)
         
-        # Average detailed scores across groups
-        final_detailed_scores = {}
-        metric_names = ['novelty', 'feasibility', 'structure', 'detail', 'logical_coherence', 'genre', 'engagement']
-        
-        for metric_name in metric_names:
-            metric_scores = [scores.get(metric_name, 0) for scores in group_detailed_scores.values()]
-            final_detailed_scores[metric_name] = sum(metric_scores) / len(metric_scores) if metric_scores else 0.0
+        # Average detailed scores across groups: a groups x metrics matrix, averaged down each column
+        score_matrix = np.array(
+            [[scores.get(metric_name, 0.0) for metric_name in METRIC_NAMES] for _, scores in group_results.values()],
+            dtype=np.float64
+        )
+        final_detailed_scores = dict(zip(METRIC_NAMES, score_matrix.mean(axis=0).tolist()))
         
         print(f"\n🎯 分组模型最终平均分数: {final_avg_score:.1f}/10")
         print(f"  最终详细分数:")
         for metric_name, score in final_detailed_scores.items():
             print(f"    {metric_name}: {score:.1f}/10")
         
-        return final_avg_score, final_detailed_scores
+        return final_avg_score, final_detailed_scores, group_results
     else:
         print("  ❌ 无有效分组评估结果")
-        sys.exit(1)
+        raise BrainstormOptimizationError("无有效分组评估结果")
 
-def save_optimized_model(module, name: str, score: float, detailed_scores: Dict[str, float] = None, mode: str = "flat"):
-    """Save optimized model with MLflow"""
+def save_optimized_model(module, name: str, score: float, detailed_scores: Dict[str, float] = None, mode: str = "flat",
+                         log_model: bool = True, parent_run_id: Optional[str] = None):
+    """Save optimized model with MLflow (log_model=False records only params and metrics, skipping the model artifact)"""
+    import mlflow
     try:
         run_name = f"brainstorm_{mode}_{name}"
-        with mlflow.start_run(run_name=run_name):
+        # Nested under the caller's run when there is one (grouped mode's parent run). MLflow's active run
+        # is per thread, so a save running in a worker thread names its parent explicitly
+        with mlflow.start_run(run_name=run_name, nested=True, parent_run_id=parent_run_id):
             # Log parameters
-            mlflow.log_param("optimization_mode", mode)
-            mlflow.log_param("optimizer_type", name)
-            mlflow.log_param("model_type", "BrainstormModule")
-            
-            # Log metrics
-            mlflow.log_metric("average_score", score)
+            mlflow.log_params({
+                "optimization_mode": mode,
+                "optimizer_type": name,
+                "model_type": "BrainstormModule"
+            })
             
-            # Log detailed scores if available
+            # Log metrics (detailed scores if available) in one request
+            metrics = {"average_score": score}
             if detailed_scores:
-                for metric_name, metric_score in detailed_scores.items():
-                    mlflow.log_metric(f"avg_{metric_name}_score", metric_score)
+                metrics.update({f"avg_{metric_name}_score": metric_score for metric_name, metric_score in detailed_scores.items()})
+            mlflow.log_metrics(metrics)
             
-            # Log model with proper input example format
-            input_example = {
-                "genre": "都市爱情",
-                "platform": "抖音",
-                "requirements_section": "浪漫甜蜜的爱情故事"
-            }
+            if not log_model:
+                print(f"📊 已记录 {name} 的参数和指标 (未保存模型)")
+                return None
             
+            # Log model with proper input example format
             model_info = mlflow.dspy.log_model(
                 module,
                 jsondoc_path="model",
-                input_example=input_example
+                input_example=MLFLOW_INPUT_EXAMPLE
             )
             
             print(f"✅ 模型已保存: {model_info.model_uri}")
             return model_info
     except Exception as e:
         print(f"❌ 模型保存失败: {e}")
-        print("停止执行")
-        sys.exit(1)
+        raise BrainstormOptimizationError(f"{name} 模型保存失败: {e}") from e
 
 def show_golden_examples_summary():
     """Show a summary of loaded golden examples"""
@@ -882,6 +1083,7 @@ def show_golden_examples_summary():
 
 def run_optimization():
     """Run optimization based on the configured mode"""
+    import mlflow
     print(f"🧪 故事创意生成优化系统 - {OPTIMIZATION_MODE.upper()} 模式")
     print("=" * 70)
     
@@ -919,27 +1121,60 @@ def run_optimization():
         grouped_modules, _ = run_grouped_optimization("medium")
         
         # Evaluate the grouped models
-        final_score, final_detailed_scores = evaluate_grouped_models(grouped_modules, test_examples)
+        final_score, final_detailed_scores, group_results = evaluate_grouped_models(grouped_modules, test_examples)
         
-        # Inspect and save results for each group
+        # Inspect and save results for each group; the group models are child runs of one parent run
         print(f"\n🔍 检查分组优化结果:")
-        for group_name, module in grouped_modules.items():
-            inspect_optimized_module(module, f"分组优化-{group_name}")
-            save_optimized_prompts(module, f"{OPTIMIZATION_MODE}_optimization_{group_name}")
+        with mlflow.start_run(run_name=f"brainstorm_{OPTIMIZATION_MODE}") as parent_run:
+            for group_name, module in grouped_modules.items():
+                inspect_optimized_module(module, f"分组优化-{group_name}")
+                save_optimized_prompts(module, f"{OPTIMIZATION_MODE}_optimization_{group_name}")
+            
+            # Groups are saved with the scores evaluate_grouped_models already measured (a group that
+            # failed evaluation there is not saved). Serializing and uploading a module is the expensive
+            # part of saving, so every group gets its own run with params and metrics but only the
+            # best group's model is logged
+            best_group = max(group_results, key=lambda name: group_results[name][0], default=None)
+            save_all_models = env_flag(SAVE_ALL_MODELS_ENV)
+            
+            # Saves are I/O-bound (tracking requests and, with SAVE_ALL_MODELS, artifact uploads), so the
+            # groups are saved concurrently, each as a child of the parent run
+            def save_group(group_name: str):
+                group_score, group_detailed = group_results[group_name]
+                return save_optimized_model(
+                    grouped_modules[group_name], f"miprov2_{group_name}", group_score, group_detailed, OPTIMIZATION_MODE,
+                    log_model=save_all_models or group_name == best_group,
+                    parent_run_id=parent_run.info.run_id
+                )
             
-            # Save individual group models
-            group_score, group_detailed = evaluate_model_performance(module, test_examples[:2], f"分组-{group_name}")
-            save_optimized_model(module, f"miprov2_{group_name}", group_score, group_detailed, OPTIMIZATION_MODE)
+            with ThreadPoolExecutor(max_workers=max(1, len(group_results))) as executor:
+                futures = {group_name: executor.submit(save_group, group_name) for group_name in group_results}
+            for group_name, future in futures.items():
+                try:
+                    future.result()
+                except BrainstormOptimizationError as e:
+                    print(f"  ⚠️ {group_name} 组模型未保存: {e}")
+            
+            # The parent run carries the whole comparison, so it can be queried without opening the child runs
+            mlflow.log_metrics({
+                "average_score": final_score,
+                **{f"avg_{metric_name}_score": metric_score for metric_name, metric_score in final_detailed_scores.items()},
+                **{f"{group_name}_score": group_score for group_name, (group_score, _) in group_results.items()}
+            })
+            if best_group is not None:
+                mlflow.set_tag("best_group", best_group)
         
         print(f"\n✅ 分组优化完成! 最终平均得分: {final_score:.1f}/10")
         
     else:
         print(f"❌ 未知的优化模式: {OPTIMIZATION_MODE}")
         print("请将 OPTIMIZATION_MODE 设置为 'flat' 或 'grouped'")
-        sys.exit(1)
+        raise BrainstormOptimizationError(f"未知的优化模式: {OPTIMIZATION_MODE}")
 
 def main():
     """Main optimization workflow"""
+    import mlflow
+    from common import LLM_MODEL_NAME
     try:
         # Extract model name for experiment naming (remove provider prefix if present)
         model_name_clean = LLM_MODEL_NAME.replace("openai/", "").replace("/", "_")
@@ -960,7 +1195,10 @@ def main():
         logger.log_configuration(config)
         
         mlflow.set_experiment(experiment_name)
-        mlflow.dspy.autolog()
+        # MLflow leaves compile tracing off by default (compiles make thousands of LM calls);
+        # MLFLOW_DSPY_TRACE_COMPILE=1 opts in
+        trace_compile = env_flag(TRACE_COMPILE_ENV)
+        mlflow.dspy.autolog(log_traces_from_compile=trace_compile, log_traces_from_eval=True)
         
         print(f"📊 MLflow 实验: {experiment_name}")
         print(f"🤖 使用模型: {LLM_MODEL_NAME}")
@@ -969,7 +1207,8 @@ def main():
         logger.log_optimization_step("mlflow_setup", {
             "experiment_name": experiment_name,
             "model_name": LLM_MODEL_NAME,
-            "autolog_enabled": True
+            "autolog_enabled": True,
+            "trace_compile": trace_compile
         }, "initialization")
         
         # Run optimization
@@ -994,4 +1233,9 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    configure_dspy()
+    if "--calibrate-judges" in sys.argv[1:]:
+        # One-off: bootstrap judge demos into JUDGES_FILE; later evaluators load them
+        calibrate_judges(create_judge_calibration_pairs())
+    else:
+        main()
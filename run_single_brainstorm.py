@@ -7,7 +7,7 @@ Demonstrates basic brainstorming functionality and evaluation
 import json
 from brainstorm_module import BrainstormModule
 from evaluators import StoryIdeaEvaluator
-from common import BrainstormRequest, StoryIdea
+from common import BrainstormRequest, StoryIdea, configure_dspy
 
 def main():
     print("🎬 Story Brainstorming - Single Run")
@@ -54,16 +54,14 @@ def main():
         try:
             # Generate ideas
             print("正在生成创意...")
-            ideas = []
-            for i in range(3):  # Generate 3 ideas for demonstration
-                prediction = brainstorm_module(
+            # Generate 3 ideas for demonstration in a single batch-prompted LLM call
+            prediction = brainstorm_module(
                 genre=test_case["request"].genre,
                 platform=test_case["request"].platform,
-                requirements_section=test_case["request"].requirements_section
+                requirements_section=test_case["request"].requirements_section,
+                n_ideas=3
             )
-                # Extract StoryIdea from DSPy prediction
-                idea = prediction.story_idea if hasattr(prediction, 'story_idea') else StoryIdea(title=prediction.title, body=prediction.body)
-                ideas.append(idea)
+            ideas = prediction.story_ideas
             
             print(f"生成了 {len(ideas)} 个创意:")
             for j, idea in enumerate(ideas, 1):
@@ -123,16 +121,14 @@ def interactive_mode():
         
         try:
             print("\n🎬 正在生成创意...")
-            ideas = []
-            for i in range(3):  # Generate 3 ideas for interactive mode
-                prediction = brainstorm_module(
+            # Generate 3 ideas for interactive mode in a single batch-prompted LLM call
+            prediction = brainstorm_module(
                 genre=request.genre,
                 platform=request.platform,
-                requirements_section=request.requirements_section
+                requirements_section=request.requirements_section,
+                n_ideas=3
             )
-                # Extract StoryIdea from DSPy prediction
-                idea = prediction.story_idea if hasattr(prediction, 'story_idea') else StoryIdea(title=prediction.title, body=prediction.body)
-                ideas.append(idea)
+            ideas = prediction.story_ideas
             
             print(f"\n生成的创意:")
             for i, idea in enumerate(ideas, 1):
@@ -158,6 +154,7 @@ def interactive_mode():
             print(f"❌ 错误: {e}")
 
 if __name__ == "__main__":
+    configure_dspy()
     # Run predefined test cases
     main()
     
@@ -59,6 +59,7 @@ message = "I enjoy ice skating"
 print(text_classifier(text=message))
 
 from dspy.teleprompt import BootstrapFewShotWithRandomSearch
+from common import max_concurrent_llm_calls
 
 
 def validate_classification(example, prediction, trace=None) -> bool:
@@ -69,7 +70,7 @@ optimizer = BootstrapFewShotWithRandomSearch(
   metric=validate_classification,
   num_candidate_programs=5,
   max_bootstrapped_demos=2,
-  num_threads=1,
+  num_threads=max_concurrent_llm_calls(),
 )
 
 compiled_pe = optimizer.compile(copy(TextClassifier()), trainset=csv_train_dataset)
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+Retries in generate_single_idea must not be answered from the LM cache
+
+Run from the repository root: python -m unittest discover -s tests
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import dspy
+from dspy.utils.dummies import DummyLM
+
+
+class CachingDummyLM(DummyLM):
+    """DummyLM that replays earlier responses the way dspy.LM(cache=True) does, unless a call passes cache=False"""
+
+    def __init__(self, answers):
+        super().__init__(answers)
+        self.responses = {}
+        self.cache_flags = []
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        use_cache = kwargs.get("cache", True)
+        self.cache_flags.append(use_cache)
+        key = repr((prompt, messages, sorted((k, repr(v)) for k, v in kwargs.items() if k != "cache")))
+        if use_cache and key in self.responses:
+            return self.responses[key]
+        outputs = super().__call__(prompt=prompt, messages=messages, **kwargs)
+        self.responses[key] = outputs
+        return outputs
+
+
+class GenerateSingleIdeaRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        # optimize_brainstorm writes its logs to the working directory
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        env = {"LLM_API_KEY": "test", "LLM_BASE_URL": "http://localhost", "LLM_MODEL_NAME": "test-model", "BRAINSTORM_CACHE": "1"}
+        self._env = mock.patch.dict(os.environ, env)
+        self._env.start()
+
+        import common
+        common._cfg.cache_clear()
+        common._response_cache_enabled.cache_clear()
+
+    def tearDown(self):
+        self._env.stop()
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def test_retry_after_bad_output_gets_a_fresh_completion(self):
+        import optimize_brainstorm
+        from brainstorm_module import BrainstormModule
+        from common import BrainstormRequest
+
+        # The first attempt's output has no body field, so both ChatAdapter and its JSONAdapter fallback fail to parse it
+        lm = CachingDummyLM([{"title": "残缺"}, {"title": "残缺"}, {"title": "新生", "body": "完整的故事梗概"}])
+        lm.kwargs["temperature"] = 1.7  # the generation LM's temperature; the first attempt still uses the cache
+
+        with dspy.context(lm=lm), mock.patch.object(optimize_brainstorm.time, "sleep"):
+            idea = optimize_brainstorm.generate_single_idea(BrainstormModule(), BrainstormRequest(genre="甜宠", platform="抖音"))
+
+        self.assertEqual(idea.title, "新生")
+        self.assertEqual(idea.body, "完整的故事梗概")
+        self.assertTrue(lm.cache_flags[0])
+        self.assertIn(False, lm.cache_flags[1:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Parsing of LLM responses into StoryIdea objects
+
+Run from the repository root: python -m unittest discover -s tests
+"""
+
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from common import (
+    StoryIdea, parse_indexed_ideas, parse_story_ideas, attempt_fix_truncated_json,
+    extract_json_with_regex, _scan_json_array
+)
+
+
+def quietly(parse, text):
+    """Run a parser without its diagnostic prints"""
+    with redirect_stdout(io.StringIO()):
+        return parse(text)
+
+
+class ParseStoryIdeasTest(unittest.TestCase):
+
+    def test_plain_array(self):
+        self.assertEqual(
+            quietly(parse_story_ideas, '[{"title": " 心动 ", "body": "雨夜相遇"}, {"title": "重逢", "body": "十年后"}]'),
+            [StoryIdea(title="心动", body="雨夜相遇"), StoryIdea(title="重逢", body="十年后")]
+        )
+
+    def test_fenced_json(self):
+        response = '```json\n[{"title": "心动", "body": "雨夜相遇"}]\n```'
+        self.assertEqual(quietly(parse_story_ideas, response), [StoryIdea(title="心动", body="雨夜相遇")])
+
+    def test_array_surrounded_by_prose(self):
+        response = '好的，以下是创意：[{"title": "心动", "body": "雨夜相遇"}] 希望你喜欢'
+        self.assertEqual(quietly(parse_story_ideas, response), [StoryIdea(title="心动", body="雨夜相遇")])
+
+    def test_truncated_array_keeps_complete_objects(self):
+        response = '[{"title": "心动", "body": "雨夜相遇"}, {"title": "重逢", "bo'
+        self.assertEqual(quietly(parse_story_ideas, response), [StoryIdea(title="心动", body="雨夜相遇")])
+
+    def test_brackets_and_escaped_quotes_inside_strings(self):
+        response = '[{"title": "第[1]章", "body": "他说：\\"{别走]\\""}]'
+        self.assertEqual(quietly(parse_story_ideas, response), [StoryIdea(title="第[1]章", body='他说："{别走]"')])
+
+    def test_non_dict_elements_give_no_ideas(self):
+        self.assertEqual(quietly(parse_story_ideas, '[1, 2]'), [])
+        self.assertEqual(quietly(parse_story_ideas, '["心动"]'), [])
+
+    def test_missing_key_gives_no_ideas(self):
+        self.assertEqual(quietly(parse_story_ideas, '[{"title": "心动"}]'), [])
+
+    def test_object_instead_of_array_gives_no_ideas(self):
+        self.assertEqual(quietly(parse_story_ideas, '{"title": "心动", "body": "雨夜相遇"}'), [])
+
+    def test_no_json_gives_no_ideas(self):
+        self.assertEqual(quietly(parse_story_ideas, '抱歉，我无法完成这个请求'), [])
+
+
+class JsonRepairTest(unittest.TestCase):
+
+    def test_fix_truncated_json_cuts_after_last_complete_object(self):
+        truncated = '[{"title": "a", "body": "b}"}, {"title": "c"'
+        self.assertEqual(attempt_fix_truncated_json(truncated), '[{"title": "a", "body": "b}"}]')
+
+    def test_fix_truncated_json_needs_an_array(self):
+        self.assertIsNone(attempt_fix_truncated_json('{"title": "a"'))
+        self.assertIsNone(attempt_fix_truncated_json('[{"title": "a"'))
+
+    def test_scan_finds_first_balanced_array(self):
+        self.assertEqual(_scan_json_array('前言 [[1, 2], [3]] 后记 [4]'), '[[1, 2], [3]]')
+
+    def test_scan_skips_brackets_inside_strings(self):
+        text = 'x [{"title": "a]", "body": "say \\"[x]\\""}] y'
+        self.assertEqual(_scan_json_array(text), '[{"title": "a]", "body": "say \\"[x]\\""}]')
+
+    def test_scan_returns_unclosed_tail_or_none(self):
+        self.assertEqual(_scan_json_array('x [1, [2'), '[1, [2')
+        self.assertIsNone(_scan_json_array('no array here'))
+
+    def test_extract_balances_missing_braces(self):
+        self.assertEqual(quietly(extract_json_with_regex, 'x [{"title": "a", "body": "b"'), [{"title": "a", "body": "b"}])
+
+    def test_extract_nested_arrays(self):
+        self.assertEqual(quietly(extract_json_with_regex, '结果：[[1, 2], [3]]'), [[1, 2], [3]])
+
+
+class ParseIndexedIdeasTest(unittest.TestCase):
+
+    def test_parses_each_marked_idea(self):
+        response = "[1] 标题: 心动 故事: 她在雨夜遇见他 [2] 标题：重逢 故事：十年后两人再次相遇"
+        self.assertEqual(parse_indexed_ideas(response), [
+            StoryIdea(title="心动", body="她在雨夜遇见他"),
+            StoryIdea(title="重逢", body="十年后两人再次相遇"),
+        ])
+
+    def test_bracketed_number_inside_body_does_not_end_the_idea(self):
+        response = "[1] 标题: 凶宅 故事: 在[2]号楼发生的命案牵出旧案 [2] 标题: 雨夜 故事: 暴雨中的相遇"
+        ideas = parse_indexed_ideas(response)
+        self.assertEqual(len(ideas), 2)
+        self.assertEqual(ideas[0].body, "在[2]号楼发生的命案牵出旧案")
+        self.assertEqual(ideas[1].title, "雨夜")
+
+    def test_skips_ideas_with_empty_title_or_body(self):
+        response = "[1] 标题:  故事: 没有标题 [2] 标题: 完整 故事: 有标题也有故事"
+        self.assertEqual(parse_indexed_ideas(response), [StoryIdea(title="完整", body="有标题也有故事")])
+
+
+if __name__ == "__main__":
+    unittest.main()
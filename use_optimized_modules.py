@@ -12,7 +12,7 @@ import random
 import itertools
 from typing import Optional, Dict, Any, List
 from brainstorm_module import BrainstormModule
-from common import BrainstormRequest, StoryIdea
+from common import BrainstormRequest, StoryIdea, extract_story_idea, configure_dspy
 
 class RequirementsVariator:
     """Generate varied requirements to avoid caching"""
@@ -300,7 +300,7 @@ def setup_environment():
     """Setup LLM and MLflow environment"""
     print("🔧 设置环境...")
     
-    # LLM is automatically configured when importing common.py
+    configure_dspy()
     # Set MLflow tracking URI (optional)
     # mlflow.set_tracking_uri("sqlite:///mlflow.db")
     
@@ -407,7 +407,7 @@ def compare_models(baseline_module: dspy.Module, optimized_module: dspy.Module,
         #         platform=request.platform,
         #         requirements_section=request.requirements_section
         #     )
-        #     baseline_idea = baseline_result.story_idea if hasattr(baseline_result, 'story_idea') else StoryIdea(title=baseline_result.title, body=baseline_result.body)
+        #     baseline_idea = extract_story_idea(baseline_result)
         #     print(f"  标题: {baseline_idea.title}")
             
         #     # Show full content or truncated based on max_content_length
@@ -428,7 +428,7 @@ def compare_models(baseline_module: dspy.Module, optimized_module: dspy.Module,
                 platform=request.platform,
                 requirements_section=request.requirements_section
             )
-            optimized_idea = optimized_result.story_idea if hasattr(optimized_result, 'story_idea') else StoryIdea(title=optimized_result.title, body=optimized_result.body)
+            optimized_idea = extract_story_idea(optimized_result)
             print(f"  标题: {optimized_idea.title}")
             
             # Show full content or truncated based on max_content_length
@@ -505,7 +505,7 @@ def demonstrate_usage():
             platform=request.platform,
             requirements_section=request.requirements_section
         )
-        idea = result.story_idea if hasattr(result, 'story_idea') else StoryIdea(title=result.title, body=result.body)
+        idea = extract_story_idea(result)
         
         print(f"✅ 生成成功:")
         print(f"  标题: {idea.title}")
@@ -558,7 +558,7 @@ def production_usage_example():
                 requirements_section=unique_requirements
             )
             
-            return result.story_idea if hasattr(result, 'story_idea') else StoryIdea(title=result.title, body=result.body)
+            return extract_story_idea(result)
         
         def generate_batch_ideas(self, genre: str, platform: str, count: int, base_requirements: str = "") -> List[StoryIdea]:
             """Generate multiple unique ideas"""
@@ -635,7 +635,7 @@ def test_cache_avoidance():
             end_time = time.time()
             duration = end_time - start_time
             
-            idea = result.story_idea if hasattr(result, 'story_idea') else StoryIdea(title=result.title, body=result.body)
+            idea = extract_story_idea(result)
             
             print(f"  用时: {duration:.2f}秒")
             print(f"  结果: 【{idea.title}】{idea.body}")
@@ -844,4 +844,5 @@ def main():
     print("✅ 演示完成！")
 
 if __name__ == "__main__":
+    configure_dspy()
     main() 
\ No newline at end of file